@@ -0,0 +1,107 @@
+"""Cold start profile: time and memory to import the app.
+
+Every sample is a fresh interpreter that imports ``workflow`` (what a
+server worker or a test run does first) and reports the wall time and its
+peak RSS. With ``--first-use`` it then also builds the agents and clients
+that are otherwise deferred to the first request. Peak RSS is reported
+after each step. No API keys are needed.
+
+    python -m benchmarks.import_time --runs 5 --top 15
+"""
+
+import argparse, json, os, statistics, subprocess, sys
+
+SAMPLE = """
+import json, resource, time
+started = time.perf_counter()
+import workflow
+imported = time.perf_counter() - started
+import_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+first_use = None
+if {first_use}:
+    from high_level_agents.registry import AGENTS, get_agent
+    from utils.llm import get_llm_client
+    from utils.web_search import get_tavily_client
+    from supabase_session import get_supabase_client
+    started = time.perf_counter()
+    for name in AGENTS:
+        get_agent(name)
+    get_llm_client(), get_tavily_client(), get_supabase_client()
+    first_use = time.perf_counter() - started
+print(json.dumps({{
+    "import": imported,
+    "first_use": first_use,
+    "import_rss_mb": import_rss,
+    "first_use_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}}))
+"""
+
+
+def sample(env: dict, first_use: bool) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", SAMPLE.format(first_use=first_use)],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout.splitlines()[-1])
+
+
+def slowest_imports(env: dict, top: int) -> list[tuple[int, str]]:
+    """(cumulative microseconds, module) of the slowest imports under workflow."""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import workflow"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            # direct imports of workflow are indented by one level
+            if name.startswith("   ") and not name.startswith("    "):
+                rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest direct imports to list")
+    parser.add_argument("--first-use", action="store_true", help="also build the deferred agents and clients")
+    args = parser.parse_args()
+
+    # only what the clients need to be constructed; nothing is contacted
+    env = {
+        **os.environ,
+        "GOOGLE_API_KEY": "stub",
+        "OPENAI_API_KEY": "stub",
+        "TAVILY_API_KEY": "stub",
+        "model": "stub-model",
+        "SUPABASE_URL": "http://127.0.0.1:1",
+        "SUPABASE_KEY": "stub.stub.stub",
+        "TRACE_EXPORT": "false",
+    }
+    samples = [sample(env, args.first_use) for _ in range(args.runs)]
+
+    def summary(key: str) -> str:
+        values = [s[key] for s in samples]
+        return f"median {statistics.median(values):.3f}  min {min(values):.3f}  max {max(values):.3f}"
+
+    print(f"import workflow (s)      {summary('import')}")
+    print(f"peak RSS (MB)            {summary('import_rss_mb')}")
+    if args.first_use:
+        print(f"first use (s)            {summary('first_use')}")
+        print(f"peak RSS after (MB)      {summary('first_use_rss_mb')}")
+    print("\nslowest direct imports of workflow (cumulative ms):")
+    for cumulative, name in slowest_imports(env, args.top):
+        print(f"  {cumulative / 1000:8.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
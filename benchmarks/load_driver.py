@@ -0,0 +1,122 @@
+"""Load driver for the ``/chat`` endpoint.
+
+Every virtual user holds a two turn conversation: a learning goal, which the
+requirement gathering agent answers with questions, then the answers, which
+start the research. Time to first token and full stream latency are reported
+per turn, with throughput and, when the stub servers are used, the per-stage
+breakdown of upstream calls.
+
+Run against a running app with::
+
+    python -m benchmarks.load_driver --app-url http://127.0.0.1:8000 --users 10
+"""
+
+import argparse, asyncio, statistics, time
+import httpx
+from mockData import profiles
+
+TURNS = [
+    ("clarify", "I want to learn Rust"),
+    ("research", "Answers: beginner, free resources, 5 hours a week"),
+]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+async def timed_chat(client: httpx.AsyncClient, query: str, uid: str) -> dict:
+    """One /chat request: time to first token, total time and response size."""
+    started = time.perf_counter()
+    ttft = None
+    size = 0
+    async with client.stream("POST", "/chat", json={"query": query, "uid": uid}) as response:
+        response.raise_for_status()  # 429/503 when admission control turns it away
+        event = None
+        async for line in response.aiter_lines():
+            # heartbeats are SSE comments; progress events are not tokens
+            if line.startswith("event:"):
+                event = line[6:].strip()
+            if not line.startswith("data:") or event != "token":
+                continue
+            if ttft is None:
+                ttft = time.perf_counter() - started
+            size += len(line) - 6
+    total = time.perf_counter() - started
+    return {"ttft": ttft if ttft is not None else total, "total": total, "bytes": size}
+
+
+async def virtual_user(client: httpx.AsyncClient, index: int, rounds: int, results: dict):
+    uid = profiles[index % len(profiles)]["uid"]
+    for _ in range(rounds):
+        for kind, query in TURNS:
+            try:
+                results[kind].append(await timed_chat(client, query, uid))
+            except httpx.HTTPError as e:
+                results["errors"].append(f"{kind}: {e!r}")
+
+
+async def run_load(app_url: str, users: int, rounds: int = 1, timeout: float = 600) -> dict:
+    """Drive users concurrent conversations and collect the timings."""
+    results = {kind: [] for kind, _ in TURNS}
+    results["errors"] = []
+    limits = httpx.Limits(max_connections=users * 2)
+    async with httpx.AsyncClient(base_url=app_url, timeout=timeout, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(virtual_user(client, i, rounds, results) for i in range(users))
+        )
+        results["wall_seconds"] = time.perf_counter() - started
+    return results
+
+
+async def fetch_stage_stats(stub_url: str) -> dict:
+    async with httpx.AsyncClient(base_url=stub_url) as client:
+        return (await client.get("/__stats")).json()
+
+
+def format_report(results: dict, stages: dict | None = None) -> str:
+    lines = []
+    completed = sum(len(results[kind]) for kind, _ in TURNS)
+    lines.append(
+        f"completed {completed} requests in {results['wall_seconds']:.2f}s "
+        f"({completed / results['wall_seconds']:.2f} req/s), {len(results['errors'])} errors"
+    )
+    lines.append(f"{'turn':<10}{'n':>5}{'ttft p50':>10}{'p90':>8}{'p99':>8}{'total p50':>11}{'p90':>8}{'p99':>8}")
+    for kind, _ in TURNS:
+        ttft = [r["ttft"] for r in results[kind]]
+        total = [r["total"] for r in results[kind]]
+        lines.append(
+            f"{kind:<10}{len(total):>5}"
+            + "".join(f"{percentile(ttft, p):>{w}.2f}" for p, w in ((50, 10), (90, 8), (99, 8)))
+            + "".join(f"{percentile(total, p):>{w}.2f}" for p, w in ((50, 11), (90, 8), (99, 8)))
+        )
+    if stages:
+        lines.append(f"{'stage':<22}{'calls':>7}{'avg s':>8}{'total s':>9}")
+        for stage, s in sorted(stages.items()):
+            avg = s["seconds"] / s["count"] if s["count"] else 0.0
+            lines.append(f"{stage:<22}{s['count']:>7}{avg:>8.3f}{s['seconds']:>9.2f}")
+    for error in results["errors"][:5]:
+        lines.append(f"error: {error}")
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--stub-url", default=None, help="stub servers, for the stage breakdown")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=1)
+    args = parser.parse_args()
+
+    results = asyncio.run(run_load(args.app_url, args.users, args.rounds))
+    stages = asyncio.run(fetch_stage_stats(args.stub_url)) if args.stub_url else None
+    print(format_report(results, stages))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Offline end-to-end benchmark of the ``/chat`` endpoint.
+
+Starts the stub servers and the app (pointed at the stubs) as subprocesses,
+drives them with the load driver and prints the report. No API keys or
+network access are needed.
+
+    python -m benchmarks.run_benchmark --users 20 --llm-ttft 0.5
+
+Flags not listed below are passed on to ``benchmarks.stub_servers``.
+"""
+
+import argparse, asyncio, os, subprocess, sys, tempfile, time
+import httpx
+from benchmarks.load_driver import fetch_stage_stats, format_report, run_load
+
+
+def wait_until_up(url: str, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=1)
+    parser.add_argument("--app-port", type=int, default=9000)
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--warm-cache", action="store_true", help="keep the cache file between runs")
+    args, stub_args = parser.parse_known_args()
+
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    app_url = f"http://127.0.0.1:{args.app_port}"
+    cache_dir = ".cache" if args.warm_cache else tempfile.mkdtemp(prefix="bench-")
+    env = {
+        **os.environ,
+        "GOOGLE_API_KEY": "stub",
+        "OPENAI_API_KEY": "stub",
+        "TAVILY_API_KEY": "stub",
+        "model": "stub-model",
+        "BASE_URL": f"{stub_url}/v1",
+        "TAVILY_BASE_URL": stub_url,
+        "SUPABASE_URL": stub_url,
+        "SUPABASE_KEY": "stub.stub.stub",
+        "CACHE_DB_PATH": os.path.join(cache_dir, "bench_cache.sqlite3"),
+        "TRACE_EXPORT": "false",
+    }
+
+    stub = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.stub_servers", "--port", str(args.stub_port), *stub_args],
+        env=env,
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "workflow:app", "--port", str(args.app_port), "--log-level", "warning"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_up(f"{stub_url}/__stats")
+        wait_until_up(f"{app_url}/system-health")
+        results = asyncio.run(run_load(app_url, args.users, args.rounds))
+        stages = asyncio.run(fetch_stage_stats(stub_url))
+        print(format_report(results, stages))
+    finally:
+        server.terminate()
+        stub.terminate()
+        server.wait()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Per-turn session overhead of each session backend.
+
+A turn is what ``/chat`` does with its session: read the history, add the
+user message and the reply, flush. Each backend is run with and without the
+hot tier, for a number of users taking turns at the same time. Supabase is
+the PostgREST stub of ``benchmarks.stub_servers`` (started here) with its
+simulated database latency, SQLite a temporary file. For the tiered backend
+the time until every background write reached Supabase is reported too.
+
+    python -m benchmarks.session_overhead --users 20 --turns 10 --db-latency 0.05
+"""
+
+import argparse, asyncio, os, statistics, subprocess, sys, tempfile, time
+from benchmarks.run_benchmark import wait_until_up
+
+BACKENDS = ("supabase", "sqlite", "tiered")
+
+
+async def run_config(backend: str, hot: bool, users: int, turns: int, reply_words: int) -> dict:
+    from utils.sessions import HotSessions, create_session, drain_replication
+
+    tier = HotSessions() if hot else None
+    latencies: list[float] = []
+    reply = " ".join(["word"] * reply_words)
+
+    async def user(uid: str) -> None:
+        for turn in range(turns):
+            started = time.perf_counter()
+            session = create_session(uid, write_behind=True, backend=backend, hot=tier)
+            await session.get_items()
+            await session.add_items(
+                [
+                    {"role": "user", "content": f"question {turn}"},
+                    {"role": "assistant", "content": reply},
+                ]
+            )
+            await session.flush()
+            latencies.append(time.perf_counter() - started)
+
+    prefix = f"{backend}-{'hot' if hot else 'cold'}"
+    started = time.perf_counter()
+    await asyncio.gather(*(user(f"{prefix}-{u}") for u in range(users)))
+    elapsed = time.perf_counter() - started
+    await drain_replication(600)
+    replicated = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "config": prefix,
+        "median": statistics.median(latencies),
+        "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "elapsed": elapsed,
+        "replicated": replicated if backend == "tiered" else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--reply-words", type=int, default=300)
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--db-latency", type=float, default=0.05, help="simulated Supabase latency (s)")
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    args = parser.parse_args()
+
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    data_dir = tempfile.mkdtemp(prefix="sessions-")
+    # read by utils.config on import, so set before the sessions module is loaded
+    os.environ.update(
+        {
+            "SUPABASE_URL": stub_url,
+            "SUPABASE_KEY": "stub.stub.stub",
+            "SESSION_DB_PATH": os.path.join(data_dir, "sessions.sqlite3"),
+        }
+    )
+    stub = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.stub_servers",
+            "--port",
+            str(args.stub_port),
+            "--db-latency",
+            str(args.db_latency),
+        ],
+    )
+    try:
+        wait_until_up(f"{stub_url}/__stats")
+        results = [
+            asyncio.run(run_config(backend, hot, args.users, args.turns, args.reply_words))
+            for backend in args.backends.split(",")
+            for hot in (False, True)
+        ]
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    print(f"\n{args.users} users x {args.turns} turns, Supabase latency {args.db_latency * 1000:.0f} ms")
+    print(f"{'backend':<16}{'median ms':>10}{'p95 ms':>10}{'total s':>10}{'replicated s':>14}")
+    for r in results:
+        replicated = f"{r['replicated']:.2f}" if r["replicated"] is not None else "-"
+        print(
+            f"{r['config']:<16}{r['median'] * 1000:>10.1f}{r['p95'] * 1000:>10.1f}"
+            f"{r['elapsed']:>10.2f}{replicated:>14}"
+        )
+
+
+if __name__ == "__main__":
+    main()
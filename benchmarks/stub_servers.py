@@ -0,0 +1,385 @@
+"""Local stand-ins for the LLM, Tavily and Supabase, for offline benchmarks.
+
+One FastAPI app serves all three upstreams:
+
+- ``/v1/chat/completions``: OpenAI compatible chat completions (streaming and
+  not). Responses are scripted from the request so the real agent chain runs
+  end to end: the requirement gathering agent asks its questions unless the
+  latest user message starts with ``Answers:``, in which case it hands off;
+  the deep research orchestrator calls its tools in order and then writes
+  the report; structured outputs get a JSON object matching their schema.
+- ``/search`` and ``/extract``: Tavily search and extract.
+- ``/rest/v1/{table}``: enough of PostgREST for ``SupabaseSession``.
+
+Latency and payload sizes are set with command line flags; ``--llm-quota``
+answers LLM calls beyond that many per second with a 429 and Retry-After,
+``--slow-model`` adds ``--slow-model-delay`` seconds to calls for that model
+and calls for ``--failing-model`` get a 503 (to exercise model routing).
+``--tail-rate`` of the non-streamed LLM calls and searches take
+``--tail-delay`` seconds longer (to exercise hedging). Per-stage call
+counts and server time are served on ``/__stats`` and cleared by
+``/__reset``.
+
+Run with::
+
+    python -m benchmarks.stub_servers --port 9100 --llm-ttft 0.3
+"""
+
+import argparse, asyncio, hashlib, itertools, json, random, time
+from collections import defaultdict
+from datetime import datetime, timezone
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Deep Research benchmark stubs")
+
+settings = argparse.Namespace(
+    llm_ttft=0.3,
+    llm_token_interval=0.01,
+    llm_tokens=200,
+    search_latency=0.8,
+    search_results=5,
+    extract_latency=1.5,
+    page_kb=20,
+    db_latency=0.05,
+    llm_quota=0.0,
+    slow_model="",
+    slow_model_delay=0.0,
+    failing_model="",
+    tail_rate=0.0,
+    tail_delay=3.0,
+)
+
+RESEARCH_STEPS = [
+    "query_generator_agent",
+    "tavily_fetch_and_extract",
+    "synthesis_agent",
+    "writer_agent",
+    "reflection_agent",
+]
+
+WORDS = (
+    "learn practice project roadmap course tutorial concept exercise build "
+    "understand master beginner advanced resource guide chapter example"
+).split()
+
+stats: dict[str, dict[str, float]] = defaultdict(lambda: {"count": 0, "seconds": 0.0})
+quota_window = {"second": 0, "calls": 0}
+
+
+def record(stage: str, started: float) -> None:
+    stats[stage]["count"] += 1
+    stats[stage]["seconds"] += time.perf_counter() - started
+
+
+@app.get("/__stats")
+async def get_stats():
+    return stats
+
+
+@app.post("/__reset")
+async def reset_stats():
+    stats.clear()
+    tables.clear()
+    return {"ok": True}
+
+
+# ---------- LLM ----------
+
+
+def over_quota() -> bool:
+    """Fixed one second window of llm_quota calls."""
+    if settings.llm_quota <= 0:
+        return False
+    second = int(time.time())
+    if quota_window["second"] != second:
+        quota_window.update(second=second, calls=0)
+    quota_window["calls"] += 1
+    return quota_window["calls"] > settings.llm_quota
+
+
+def tail() -> float:
+    """Extra latency of the occasional straggler."""
+    return settings.tail_delay if random.random() < settings.tail_rate else 0.0
+
+
+def _text(n_tokens: int) -> str:
+    return " ".join(WORDS[i % len(WORDS)] for i in range(n_tokens))
+
+
+def _last_user_text(messages: list[dict]) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            content = message.get("content")
+            if isinstance(content, list):
+                content = " ".join(p.get("text", "") for p in content)
+            return content or ""
+    return ""
+
+
+def _structured_output(schema: dict) -> str:
+    properties = schema.get("properties", {})
+    if "is_relevant" in properties:
+        return json.dumps({"is_relevant": True})
+    if "refined_queries" in properties:
+        return json.dumps(
+            {
+                "master_query": "learn rust programming roadmap",
+                "refined_queries": [f"rust learning resource {i}" for i in range(5)],
+                "research_plan": "search, extract, synthesize, write",
+            }
+        )
+    return json.dumps({key: "" for key in properties})
+
+
+def _script(body: dict) -> tuple[str, str, dict | None]:
+    """Decide the stage name and the reply (text or tool call) for a request."""
+    messages = body.get("messages", [])
+    tools = {t["function"]["name"] for t in body.get("tools") or []}
+    response_format = body.get("response_format") or {}
+
+    if response_format.get("type") == "json_schema":
+        schema = response_format["json_schema"].get("schema", {})
+        stage = "llm:guardrail" if "is_relevant" in schema.get("properties", {}) else "llm:structured"
+        return stage, _structured_output(schema), None
+
+    handoff = next((t for t in tools if t.startswith("transfer_to_")), None)
+    if handoff:
+        if _last_user_text(messages).startswith("Answers:"):
+            args = {"query": "learn rust", "requirements": ["beginner", "free resources"]}
+            return "llm:requirements", "", {"name": handoff, "arguments": json.dumps(args)}
+        return "llm:requirements", "1. What is your level?\n2. Free or paid resources?", None
+
+    if "tavily_fetch_and_extract" in tools:
+        last_user = max(
+            (i for i, m in enumerate(messages) if m.get("role") == "user"), default=0
+        )
+        done = sum(1 for m in messages[last_user:] if m.get("role") == "tool")
+        if done < len(RESEARCH_STEPS):
+            name = RESEARCH_STEPS[done]
+            if name == "tavily_fetch_and_extract":
+                args = {"queries": [f"rust learning resource {i}" for i in range(5)]}
+            else:
+                args = {"input": _text(50)}
+            return "llm:orchestrator", "", {"name": name, "arguments": json.dumps(args)}
+        return "llm:orchestrator", "# Report\n\n" + _text(settings.llm_tokens), None
+
+    return "llm:sub_agent", _text(settings.llm_tokens), None
+
+
+def _chunk(body: dict, delta: dict, finish_reason: str | None = None) -> str:
+    payload = {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    started = time.perf_counter()
+    body = await request.json()
+    if over_quota():
+        record("llm:rate_limited", started)
+        return JSONResponse(
+            {"error": {"message": "Rate limit exceeded", "type": "rate_limit_error"}},
+            status_code=429,
+            headers={"Retry-After": "1"},
+        )
+    if body.get("model") == settings.failing_model:
+        record("llm:model_failed", started)
+        return JSONResponse(
+            {"error": {"message": "Model overloaded", "type": "server_error"}}, status_code=503
+        )
+    if body.get("model") == settings.slow_model:
+        await asyncio.sleep(settings.slow_model_delay)
+    stage, text, tool_call = _script(body)
+    usage = {
+        "prompt_tokens": len(json.dumps(body.get("messages", []))) // 4,
+        "completion_tokens": len(text.split()) or 20,
+    }
+    usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+    await asyncio.sleep(settings.llm_ttft)
+
+    if not body.get("stream"):
+        await asyncio.sleep(settings.llm_token_interval * usage["completion_tokens"] + tail())
+        message = {"role": "assistant", "content": text or None}
+        if tool_call:
+            message["tool_calls"] = [
+                {"id": "call_stub", "type": "function", "function": tool_call}
+            ]
+        record(stage, started)
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": message,
+                    "finish_reason": "tool_calls" if tool_call else "stop",
+                }
+            ],
+            "usage": usage,
+        }
+
+    async def stream():
+        yield _chunk(body, {"role": "assistant", "content": ""})
+        if tool_call:
+            delta = {
+                "tool_calls": [
+                    {"index": 0, "id": "call_stub", "type": "function", "function": tool_call}
+                ]
+            }
+            yield _chunk(body, delta)
+        else:
+            for word in text.split(" "):
+                await asyncio.sleep(settings.llm_token_interval)
+                yield _chunk(body, {"content": word + " "})
+        yield _chunk(body, {}, "tool_calls" if tool_call else "stop")
+        final = {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [],
+            "usage": usage,
+        }
+        yield f"data: {json.dumps(final)}\n\n"
+        yield "data: [DONE]\n\n"
+        record(stage, started)
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+# ---------- Tavily ----------
+
+
+@app.post("/search")
+async def tavily_search(request: Request):
+    started = time.perf_counter()
+    body = await request.json()
+    await asyncio.sleep(settings.search_latency + tail())
+    query = body.get("query", "")
+    slug = hashlib.md5(query.encode()).hexdigest()[:8]
+    results = [
+        {
+            "title": f"{query} #{i}",
+            "url": f"https://example.com/{slug}/{i}",
+            "content": _text(40),
+            "score": 0.95 - i * 0.01,
+        }
+        for i in range(settings.search_results)
+    ]
+    record("tavily:search", started)
+    return {"query": query, "results": results, "response_time": settings.search_latency}
+
+
+@app.post("/extract")
+async def tavily_extract(request: Request):
+    started = time.perf_counter()
+    body = await request.json()
+    urls = body.get("urls", [])
+    urls = [urls] if isinstance(urls, str) else urls
+    await asyncio.sleep(settings.extract_latency)
+    page = _text(settings.page_kb * 1024 // 8)
+    results = [{"url": url, "raw_content": f"{url}\n\n{page}"} for url in urls]
+    record("tavily:extract", started)
+    return {"results": results, "failed_results": [], "response_time": settings.extract_latency}
+
+
+# ---------- Supabase (PostgREST) ----------
+
+tables: dict[str, list[dict]] = defaultdict(list)
+row_ids = itertools.count(1)
+
+
+def _matches(row: dict, params) -> bool:
+    for key, value in params.items():
+        if key in ("select", "order", "limit", "on_conflict", "columns"):
+            continue
+        op, _, operand = value.partition(".")
+        field = row.get(key)
+        if op == "eq" and str(field) != operand:
+            return False
+        if op == "gte" and (field is None or float(field) < float(operand)):
+            return False
+    return True
+
+
+@app.api_route("/rest/v1/{table}", methods=["GET", "POST", "PATCH", "DELETE"])
+async def postgrest(table: str, request: Request):
+    started = time.perf_counter()
+    await asyncio.sleep(settings.db_latency)
+    rows = tables[table]
+    params = request.query_params
+
+    if request.method == "POST":
+        payload = await request.json()
+        payload = payload if isinstance(payload, list) else [payload]
+        upsert = "merge-duplicates" in request.headers.get("prefer", "")
+        inserted = []
+        for item in payload:
+            if upsert and "session_id" in item:
+                existing = next(
+                    (r for r in rows if r.get("session_id") == item["session_id"]), None
+                )
+                if existing:
+                    existing.update(item)
+                    inserted.append(existing)
+                    continue
+            row = {
+                "id": next(row_ids),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                **item,
+            }
+            rows.append(row)
+            inserted.append(row)
+        record("supabase:write", started)
+        return JSONResponse(inserted, status_code=201)
+
+    matched = [row for row in rows if _matches(row, params)]
+    if request.method == "PATCH":
+        payload = await request.json()
+        for row in matched:
+            row.update(payload)
+        record("supabase:write", started)
+        return matched
+    if request.method == "DELETE":
+        for row in matched:
+            rows.remove(row)
+        record("supabase:write", started)
+        return matched
+
+    order = params.get("order", "")
+    if order:
+        # the last sort key is applied first so the first one dominates
+        for key in reversed(order.split(",")):
+            field, _, direction = key.partition(".")
+            matched.sort(key=lambda r: str(r.get(field, "")).zfill(20), reverse=direction.startswith("desc"))
+    if "limit" in params:
+        matched = matched[: int(params["limit"])]
+    record("supabase:read", started)
+    return matched
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    for name, default in vars(settings).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(default), default=default)
+    args = parser.parse_args()
+    for name in vars(settings):
+        setattr(settings, name, getattr(args, name))
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
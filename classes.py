@@ -1,5 +1,8 @@
 from dataclasses import dataclass
+from typing import Optional
 from pydantic import BaseModel
+from high_level_agents.models import ResearchRequest
+from utils.deadline import Deadline
 
 
 # class to check if the question/user query is relevant to the Deep Research topic
@@ -13,3 +16,7 @@ class UserProfile:
     name: str
     city: str
     uid: str
+    # set when the requirement gathering agent hands off to the research
+    research_request: Optional[ResearchRequest] = None
+    # when the answer is due, set as the request arrives
+    deadline: Optional[Deadline] = None
@@ -2,13 +2,12 @@ import datetime
 import os, asyncio
 from agents import (
     Agent,
-    AsyncOpenAI,
-    OpenAIChatCompletionsModel,
+    ItemHelpers,
+    Runner,
     function_tool,
     RunContextWrapper,
 )
 from dotenv import load_dotenv
-from tavily import AsyncTavilyClient
 from classes import UserProfile
 from agents.extensions.handoff_prompt import RECOMMENDED_PROMPT_PREFIX
 from logger_colors import BLUE, GREEN, RED, RESET
@@ -16,31 +15,21 @@ from high_level_agents.qa_generator import query_generator_agent
 from high_level_agents.synthesis_agent import synthesis_agent
 from high_level_agents.writer_agent import writer_agent
 from high_level_agents.reflection_agent import reflection_agent
-from utils.config import GOOGLE_API_KEY, TAVILY_API_KEY, BASE_URL, MODEL
+from utils.deadline import budgeted_writer, search_limits, skip_reflection
+from utils.model_router import get_routed_model
+from utils.web_search import fetch_documents
 
 load_dotenv()
 
 
-google_key = GOOGLE_API_KEY
-tavily_key = TAVILY_API_KEY
-base_url = BASE_URL
-
-# Setting the OpenAI client
-client: AsyncOpenAI = AsyncOpenAI(
-    api_key=google_key,
-    base_url=base_url,
-)
-
-# setting the LLM model using OpenAIChatCompletionsModel
-llm: OpenAIChatCompletionsModel = OpenAIChatCompletionsModel(
-    model=MODEL, openai_client=client
-)
-
-tavily_client = AsyncTavilyClient(api_key=TAVILY_API_KEY)
+# setting the LLM model on the shared, pooled client
+llm = get_routed_model("deep_research")
 
 
 @function_tool
-async def tavily_fetch_and_extract(queries: list[str]) -> list[dict]:
+async def tavily_fetch_and_extract(
+    wrapper: RunContextWrapper[UserProfile], queries: list[str]
+) -> list[dict]:
     """
     Perform search, rank results, and extract relevant content in one step.
 
@@ -48,45 +37,60 @@ async def tavily_fetch_and_extract(queries: list[str]) -> list[dict]:
         queries: A list of queries(str)
 
     Returns:
-        A list of extracted data per URL (with title, url, content, etc.)
+        A list of extracted documents (with title, url, score, raw_content
+        holding only the page's passages most relevant to the queries, and
+        sources, the urls of every near-duplicate copy)
     """
 
-    print(f"{BLUE} type {RESET}", isinstance(queries, list))
     print(f"{BLUE} Running tavily tool {RESET}", queries)
-    # Step 1: Perform searches
-    responses = await asyncio.gather(*[tavily_client.search(query=q) for q in queries])
-
-    # Step 2: Filter & collect relevant URLs
-    relevant_urls = []
-    for response in responses:
-        for result in response.get("results", []):
-            if result.get("score", 0) > 0.8:  # simple threshold
-                relevant_urls.append(result.get("url"))
-
-    print(f"Found {relevant_urls} relevant URLs")
-    # Step 3: Extract data from the relevant URLs
-    extracted_data = await asyncio.gather(
-        *(tavily_client.extract(url) for url in relevant_urls)
-    )
+    # Searches stream their relevant URLs straight into extraction
+    extracted_data = await fetch_documents(queries, *search_limits(wrapper.context.deadline))
 
     # print(f"{BLUE}extracted data {RESET}", extracted_data)
 
     return extracted_data
 
 
+@function_tool(
+    name_override="writer_agent",
+    description_override="Generates a polished final report from the synthesized insights.",
+)
+async def write_report(wrapper: RunContextWrapper[UserProfile], input: str) -> str:
+    # writer_agent.as_tool, with the output budget left by the deadline
+    writer = budgeted_writer(writer_agent, wrapper.context.deadline)
+    result = await Runner.run(writer, input, context=wrapper.context)
+    return ItemHelpers.text_message_outputs(result.new_items)
+
+
+@function_tool(
+    name_override="reflection_agent",
+    description_override="Acts as a final quality checker for the Markdown report according to the user requirements.",
+)
+async def check_report(wrapper: RunContextWrapper[UserProfile], input: str) -> str:
+    # reflection_agent.as_tool, skipped when the deadline leaves no time for it
+    if skip_reflection(wrapper.context.deadline):
+        return "Out of time for the quality check: deliver the report as it is."
+    result = await Runner.run(reflection_agent, input, context=wrapper.context)
+    return ItemHelpers.text_message_outputs(result.new_items)
+
+
 # deep research agent instructions
 def deep_research_instructions(
     wrapper: RunContextWrapper[UserProfile], agent: Agent[UserProfile]
 ) -> str:
     today_date = datetime.datetime.now().strftime("%Y-%m-%d")
     current_year = today_date[:4]
+    deadline = wrapper.context.deadline
+    time_left = ""
+    if deadline is not None and deadline.share() < 1:
+        time_left = f"\n- Time left to answer: {deadline.remaining():.0f} seconds. Call each tool at most once and deliver the report."
     return f"""{RECOMMENDED_PROMPT_PREFIX}
 You are the **{agent.name}**.
 Your role is to conduct deep research based on the user's requirements gathered by the Requirement Gathering Agent (RG).
 
 ### Context:
 - Today's date: {today_date}
-- Current year: {current_year}
+- Current year: {current_year}{time_left}
 
 ### Style:
 You have access to different tools that you can use to enhance your research process. These tools include:
@@ -105,8 +109,7 @@ You have access to different tools that you can use to enhance your research pro
 - Respond with the finalized report only in markdown(containing all links, headings, citations etc). No intermediate steps or explanations.
 - Donot remove anything important while passing information to other agents like links to the learning materials, citations etc.
 
-User Profile Context:  
-Name: {wrapper.context.name}
+Reports are shared between learners with the same request: do not address the reader by name or include personal details.
 """
 
 
@@ -125,13 +128,7 @@ deep_research_agent: Agent = Agent(
             tool_name="synthesis_agent",
             tool_description="Analyzes and synthesizes extracted information.",
         ),
-        writer_agent.as_tool(
-            tool_name="writer_agent",
-            tool_description="Generates a polished final report from the synthesized insights.",
-        ),
-        reflection_agent.as_tool(
-            tool_name="reflection_agent",
-            tool_description="Acts as a final quality checker for the Markdown report according to the user requirements.",
-        ),
+        write_report,
+        check_report,
     ],
 )
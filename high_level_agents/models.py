@@ -2,6 +2,16 @@ from pydantic import BaseModel
 from typing import List, Optional
 
 
+# Handed over by the requirement gathering agent to start the research
+class ResearchRequest(BaseModel):
+    query: str
+    requirements: List[str]
+
+    def cache_key(self) -> str:
+        """Text identifying this request in the report cache."""
+        return "\n".join([self.query, *sorted(self.requirements)])
+
+
 # For planner agent
 class ResearchPlan(BaseModel):
     master_query: str
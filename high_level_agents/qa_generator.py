@@ -1,10 +1,9 @@
-from agents import Agent, AsyncOpenAI, OpenAIChatCompletionsModel, RunContextWrapper
+from agents import Agent, RunContextWrapper
 from classes import UserProfile
 from .models import ResearchPlan
-from utils.config import GOOGLE_API_KEY, BASE_URL, MODEL
+from utils.model_router import get_routed_model
 
-client = AsyncOpenAI(api_key=GOOGLE_API_KEY, base_url=BASE_URL)
-llm = OpenAIChatCompletionsModel(model=MODEL, openai_client=client)
+llm = get_routed_model("query_generator")
 
 
 def qg_instructions(
@@ -27,3 +26,6 @@ query_generator_agent = Agent(
     model=llm,
     # output_type=ResearchPlan,
 )
+
+# The query generator with a structured output, so its plan can be used directly
+query_planner_agent = query_generator_agent.clone(output_type=ResearchPlan)
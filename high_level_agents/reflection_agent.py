@@ -1,10 +1,9 @@
-from agents import Agent, AsyncOpenAI, OpenAIChatCompletionsModel, RunContextWrapper
+from agents import Agent, RunContextWrapper
 from classes import UserProfile
 import datetime
-from utils.config import GOOGLE_API_KEY, BASE_URL, MODEL
+from utils.model_router import get_routed_model
 
-client = AsyncOpenAI(api_key=GOOGLE_API_KEY, base_url=BASE_URL)
-llm = OpenAIChatCompletionsModel(model=MODEL, openai_client=client)
+llm = get_routed_model("reflection")
 
 
 def reflection_agent_instructions(
@@ -33,8 +32,6 @@ Your role is to act as a **final quality checker** for the Markdown report produ
 - Never output JSON, explanations, or metadata.  
 - Never invent new facts — only restructure or correct what was already written.  
 
-User Profile Context:  
-Name: {wrapper.context.name}
 """
 
 
@@ -0,0 +1,26 @@
+import importlib
+from agents import Agent
+
+# Agent name -> "module:attribute". An agent's module (and the modules of
+# the agents it hands off to or uses as tools) is only imported, and so the
+# agent only built, the first time it is asked for.
+AGENTS = {
+    "requirement_gathering": "high_level_agents.requirement_gathering_agent:requirement_gathering_agent",
+    "deep_research": "high_level_agents.deep_research_agent:deep_research_agent",
+    "query_generator": "high_level_agents.qa_generator:query_generator_agent",
+    "query_planner": "high_level_agents.qa_generator:query_planner_agent",
+    "synthesis": "high_level_agents.synthesis_agent:synthesis_agent",
+    "writer": "high_level_agents.writer_agent:writer_agent",
+    "reflection": "high_level_agents.reflection_agent:reflection_agent",
+}
+
+_agents: dict[str, Agent] = {}
+
+
+def get_agent(name: str) -> Agent:
+    """The named agent, built on first use."""
+    agent = _agents.get(name)
+    if agent is None:
+        module, attribute = AGENTS[name].split(":")
+        agent = _agents[name] = getattr(importlib.import_module(module), attribute)
+    return agent
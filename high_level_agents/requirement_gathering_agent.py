@@ -1,12 +1,11 @@
-import datetime, os
+import datetime, hashlib, os
 from agents import (
     Agent,
     Runner,
-    AsyncOpenAI,
-    OpenAIChatCompletionsModel,
     RunContextWrapper,
     GuardrailFunctionOutput,
     TResponseInputItem,
+    handoff,
     input_guardrail,
 )
 from classes import UserQuestionGuardRail
@@ -15,38 +14,91 @@ from classes import UserProfile
 from agents.extensions.handoff_prompt import RECOMMENDED_PROMPT_PREFIX
 from logger_colors import BLUE, GREEN, RED, RESET
 from high_level_agents.deep_research_agent import deep_research_agent
-from utils.config import GOOGLE_API_KEY, TAVILY_API_KEY, BASE_URL, MODEL
+from high_level_agents.models import ResearchRequest
+from utils.cache import TTLCache
+from utils.model_router import get_routed_model
+from utils.query_classifier import classify_query, normalize_text
+from utils.config import GUARDRAIL_CACHE_TTL
 
 load_dotenv()
 
-google_key = GOOGLE_API_KEY
-tavily_key = TAVILY_API_KEY
-base_url = BASE_URL
-
-# Setting the OpenAI client
-client: AsyncOpenAI = AsyncOpenAI(
-    api_key=google_key,
-    base_url=base_url,
-)
-
-# setting the LLM model using OpenAIChatCompletionsModel
-llm: OpenAIChatCompletionsModel = OpenAIChatCompletionsModel(
-    model=MODEL, openai_client=client
-)
+# each agent's model comes from its route (see MODEL_ROUTES), on the shared, pooled client
+llm = get_routed_model("requirement_gathering")
 
 guardrail_agent = Agent(
     name="User Query Validation Agent",
     instructions="Check if the user query is about the deep research topic of learning a new skill.",
     output_type=UserQuestionGuardRail,
-    model=llm,
+    model=get_routed_model("guardrail"),
 )
 
+# LLM guardrail verdicts keyed by the questions answered and normalized input
+verdict_cache = TTLCache("guardrail_verdicts", ttl=GUARDRAIL_CACHE_TTL)
+
+# an assistant message longer than this is a report, not clarifying questions
+CLARIFYING_MAX_WORDS = 300
+
+
+def _item_text(item: TResponseInputItem) -> str:
+    content = item.get("content")
+    if isinstance(content, list):
+        content = " ".join(
+            part.get("text", "") for part in content if isinstance(part, dict)
+        )
+    return content or ""
+
+
+def _latest_user_text(input: str | list[TResponseInputItem]) -> tuple[str, str]:
+    """The latest user message and the clarifying questions it answers, if any.
+
+    The input holds the user's whole stored history, so only an assistant
+    message right before the latest user message counts: one that asks
+    questions and is too short to be a finished report.
+    """
+    if isinstance(input, str):
+        return input, ""
+    for i in range(len(input) - 1, -1, -1):
+        item = input[i]
+        if isinstance(item, dict) and item.get("role") == "user":
+            previous = input[i - 1] if i > 0 else None
+            questions = ""
+            if isinstance(previous, dict) and previous.get("role") == "assistant":
+                asked = _item_text(previous)
+                if "?" in asked and len(asked.split()) <= CLARIFYING_MAX_WORDS:
+                    questions = asked
+            return _item_text(item), questions
+    return "", ""
+
 
 @input_guardrail
 async def User_Query_Guardrail(
     ctx: RunContextWrapper[None], agent: Agent, input: str | list[TResponseInputItem]
 ) -> GuardrailFunctionOutput:
+    text, questions = _latest_user_text(input)
+
+    # Tier 1: cheap local classifier for the obvious cases
+    verdict = classify_query(text, bool(questions))
+    if verdict is not None:
+        print(f"{GREEN} Guardrail fast path {RESET}=>", verdict)
+        return GuardrailFunctionOutput(
+            output_info=UserQuestionGuardRail(is_relevant=verdict),
+            tripwire_triggered=not verdict,
+        )
+
+    # Tier 2: verdicts of earlier LLM checks on the same input and session state
+    answering = hashlib.sha1(questions.encode()).hexdigest()[:16] if questions else "-"
+    key = f"{answering}:{normalize_text(text)}"
+    cached = await verdict_cache.get(key)
+    if cached is not None:
+        print(f"{GREEN} Guardrail cache hit {RESET}=>", cached)
+        return GuardrailFunctionOutput(
+            output_info=UserQuestionGuardRail(**cached),
+            tripwire_triggered=not cached["is_relevant"],
+        )
+
+    # Tier 3: ask the guardrail agent
     result = await Runner.run(guardrail_agent, input, context=ctx.context)
+    await verdict_cache.set(key, result.final_output.model_dump())
 
     # print(f"{GREEN} Guardrail Result {RESET}=>", result)
 
@@ -78,7 +130,7 @@ Your role is to collect the learner’s preferences before the Deep Research Age
 1. Review the user’s query (the topic they want to learn).  
 2. Ask **up to 4, 5 short clarifying questions** to gather requirements from the user. 
 3. If the user is unsure, suggest a reasonable default and move on.  
-4. Once you have their answers, stop asking and **handoff to the Deep Research Agent (DRA)** with the user query + requirements.  
+4. Once you have their answers, stop asking and **handoff to the Deep Research Agent (DRA)** with the user query + requirements (one short statement per requirement).  
 
 ### Style:
 - Be conversational, natural, and concise.  
@@ -92,10 +144,23 @@ Name: {wrapper.context.name}
 """
 
 
+def on_research_handoff(
+    wrapper: RunContextWrapper[UserProfile], request: ResearchRequest
+) -> None:
+    print(f"{GREEN} Research request {RESET}=>", request)
+    wrapper.context.research_request = request
+
+
 requirement_gathering_agent: Agent = Agent(
     name="Requirement Gathering Agent",
     instructions=rg_agent_instructions,
     model=llm,
-    handoffs=[deep_research_agent],
+    handoffs=[
+        handoff(
+            deep_research_agent,
+            on_handoff=on_research_handoff,
+            input_type=ResearchRequest,
+        )
+    ],
     input_guardrails=[User_Query_Guardrail],
 )
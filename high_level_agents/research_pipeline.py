@@ -0,0 +1,137 @@
+import os, re
+from dataclasses import dataclass
+from typing import AsyncGenerator, Optional
+from agents import Runner, RunConfig
+from openai.types.responses import ResponseTextDeltaEvent
+from classes import UserProfile
+from logger_colors import BLUE, GREEN, RESET
+from high_level_agents.models import ResearchPlan, ResearchRequest
+from high_level_agents.registry import get_agent
+from utils.config import RESEARCH_REFLECTION
+from utils.deadline import budgeted_writer, search_limits, skip_reflection
+from utils.web_search import fetch_documents
+
+REQUIRED_SECTIONS = ["Executive Summary", "Roadmap", "Resource", "Citations"]
+
+
+@dataclass
+class ResearchEvent:
+    """One item of the research stream.
+
+    kind is "progress" (a stage update for the user), "token" (a piece of the
+    report as the writer produces it) or "revise" (the report after
+    reflection differs: everything from offset on is replaced by data).
+    """
+
+    kind: str
+    data: str
+    offset: int = 0
+
+
+def request_prompt(request: ResearchRequest) -> str:
+    requirements = "\n".join(f"- {r}" for r in request.requirements)
+    return f"User query: {request.query}\n\nRequirements:\n{requirements}"
+
+
+def synthesis_prompt(request: ResearchRequest, documents: list[dict]) -> str:
+    sources = []
+    for doc in documents:
+        also = [url for url in doc.get("sources", []) if url != doc["url"]]
+        header = f"### {doc.get('title') or doc['url']}\nURL: {doc['url']}"
+        if also:
+            header += f"\nAlso published at: {', '.join(also)}"
+        sources.append(f"{header}\n\n{doc.get('raw_content') or ''}")
+    return f"{request_prompt(request)}\n\n## Extracted sources\n\n" + "\n\n".join(sources)
+
+
+def revision(report: str, revised: str) -> Optional[ResearchEvent]:
+    """The smallest paragraph aligned tail replacement turning report into revised.
+
+    The offset is the start of the paragraph where the two first differ, so
+    report[:offset] + data == revised.
+    """
+    if revised.strip() == report.strip():
+        return None
+    common = len(os.path.commonprefix([report, revised]))
+    boundary = report.rfind("\n\n", 0, common)
+    offset = boundary + 2 if boundary >= 0 else 0
+    return ResearchEvent("revise", revised[offset:], offset)
+
+
+def report_issues(report: str) -> list[str]:
+    """Cheap local quality check of a Markdown report."""
+    issues = []
+    if not re.search(r"^#{1,3} ", report, re.MULTILINE):
+        issues.append("no Markdown headings")
+    for section in REQUIRED_SECTIONS:
+        if section.lower() not in report.lower():
+            issues.append(f"missing section: {section}")
+    if not re.search(r"\[[^\]]+\]\(https?://[^)\s]+\)", report):
+        issues.append("no links")
+    if report.count("```") % 2:
+        issues.append("unclosed code block")
+    if re.search(r"\]\s+\(http", report):
+        issues.append("broken link syntax")
+    return issues
+
+
+async def run_research_pipeline(
+    request: ResearchRequest,
+    context: UserProfile,
+    run_config: Optional[RunConfig] = None,
+) -> AsyncGenerator[ResearchEvent, None]:
+    """Code-driven research: plan, search, synthesize, write, reflect.
+
+    Runs the same stages the Deep Research Agent orchestrates, but calls them
+    directly in order, so no orchestrator turns are spent and each stage only
+    sees the input it needs. Progress events are yielded as stages start, the
+    writer's tokens as they are produced and, if reflection changes the
+    report, a single revise event. As the context's deadline nears, fewer
+    sources are extracted, the report gets shorter and reflection is skipped.
+    """
+    yield ResearchEvent("progress", "Planning the research")
+    plan_result = await Runner.run(
+        get_agent("query_planner"), request_prompt(request), context=context, run_config=run_config
+    )
+    plan: ResearchPlan = plan_result.final_output
+    print(f"{BLUE} Research plan {RESET}=>", plan.master_query, plan.refined_queries)
+
+    queries = [plan.master_query, *plan.refined_queries]
+    yield ResearchEvent("progress", f"Searching the web ({len(queries)} queries)")
+    documents = await fetch_documents(queries, *search_limits(context.deadline))
+
+    yield ResearchEvent("progress", f"Found {len(documents)} sources, synthesizing")
+    synthesis = await Runner.run(
+        get_agent("synthesis"),
+        synthesis_prompt(request, documents),
+        context=context,
+        run_config=run_config,
+    )
+
+    yield ResearchEvent("progress", "Writing the report")
+    writer = Runner.run_streamed(
+        budgeted_writer(get_agent("writer"), context.deadline),
+        f"{request_prompt(request)}\n\n## Synthesized insights\n\n{synthesis.final_output}",
+        context=context,
+        run_config=run_config,
+    )
+    async for event in writer.stream_events():
+        if (
+            event.type == "raw_response_event"
+            and isinstance(event.data, ResponseTextDeltaEvent)
+            and event.data.delta
+        ):
+            yield ResearchEvent("token", event.data.delta)
+    report: str = writer.final_output
+
+    issues = report_issues(report) if RESEARCH_REFLECTION == "check" else []
+    if (RESEARCH_REFLECTION == "always" or issues) and not skip_reflection(context.deadline):
+        print(f"{BLUE} Running reflection {RESET}=>", issues or RESEARCH_REFLECTION)
+        reflection = await Runner.run(
+            get_agent("reflection"), report, context=context, run_config=run_config
+        )
+        correction = revision(report, reflection.final_output)
+        if correction:
+            yield correction
+    else:
+        print(f"{GREEN} Reflection skipped {RESET}")
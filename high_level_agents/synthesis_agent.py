@@ -1,11 +1,10 @@
-from agents import Agent, AsyncOpenAI, OpenAIChatCompletionsModel, RunContextWrapper
+from agents import Agent, RunContextWrapper
 from classes import UserProfile
 import datetime
 
-from utils.config import GOOGLE_API_KEY, BASE_URL, MODEL
+from utils.model_router import get_routed_model
 
-client = AsyncOpenAI(api_key=GOOGLE_API_KEY, base_url=BASE_URL)
-llm = OpenAIChatCompletionsModel(model=MODEL, openai_client=client)
+llm = get_routed_model("synthesis")
 
 
 def synthesis_agent_instructions(
@@ -29,8 +28,6 @@ Your role is to analyze and synthesize the extracted information gathered from m
 - A **synthesis report** (bullet points, grouped by themes or categories, links).  
 - Include **citations/source attribution** when available.  
 
-User Profile Context:  
-Name: {wrapper.context.name}
 """
 
 
@@ -1,10 +1,9 @@
-from agents import Agent, AsyncOpenAI, OpenAIChatCompletionsModel, RunContextWrapper
+from agents import Agent, RunContextWrapper
 from classes import UserProfile
 import os, datetime
-from utils.config import GOOGLE_API_KEY, BASE_URL, MODEL
+from utils.model_router import get_routed_model
 
-client = AsyncOpenAI(api_key=GOOGLE_API_KEY, base_url=BASE_URL)
-llm = OpenAIChatCompletionsModel(model=MODEL, openai_client=client)
+llm = get_routed_model("writer")
 
 
 def writer_agent_instructions(
@@ -37,8 +36,7 @@ Your role is to take synthesized insights (from the Synthesis Agent) and produce
 ### Output:
 - A **single, optimized Markdown report** ready for the user.  
 
-User Profile Context:  
-Name: {wrapper.context.name}
+Reports are shared between learners with the same request: do not address the reader by name or include personal details.
 """
 
 
@@ -1,4 +1,4 @@
-import asyncio, os
+import argparse, asyncio, os
 import sys
 from dotenv import load_dotenv
 
@@ -12,6 +12,34 @@ import uvicorn
 
 if __name__ == "__main__":
     # ✅ THIS GUARD is required on Windows when using multiprocessing / reload
-    host = os.getenv("HOST", "127.0.0.1")
-    PORT = os.getenv("PORT", 8000)
-    uvicorn.run("workflow:app", host=host, port=os.getenv("PORT", 8000), reload=True)
+    parser = argparse.ArgumentParser(description="Run the Deep Research Agent API")
+    parser.add_argument(
+        "--production",
+        action="store_true",
+        help="run several worker processes without auto-reload",
+    )
+    parser.add_argument(
+        "--workers", type=int, help="worker processes in production mode (default: WEB_CONCURRENCY or one per CPU)"
+    )
+    args = parser.parse_args()
+
+    from utils.config import GRACEFUL_SHUTDOWN_SECONDS, HOST, PORT, WEB_CONCURRENCY, validate_config
+
+    validate_config()
+
+    if args.production:
+        workers = args.workers or WEB_CONCURRENCY
+        if workers > 1:
+            # workers are separate processes: share the rate limits through the cache db
+            os.environ["RATE_LIMIT_SHARED"] = "true"
+            # an in-memory session of one worker goes stale when the next turn lands on another
+            os.environ.setdefault("SESSION_HOT_ENTRIES", "0")
+        uvicorn.run(
+            "workflow:app",
+            host=HOST,
+            port=PORT,
+            workers=workers,
+            timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_SECONDS,
+        )
+    else:
+        uvicorn.run("workflow:app", host=HOST, port=PORT, reload=True)
@@ -1,22 +1,53 @@
 import asyncio, os
-from typing import List, Optional
-from supabase import create_client, Client
+from typing import TYPE_CHECKING, List, Optional
 from agents.memory import Session
 from agents import TResponseInputItem
-from utils.config import SUPABASE_URL, SUPABASE_KEY
+from utils import metrics
+from utils.config import SUPABASE_URL, SUPABASE_KEY, HISTORY_MAX_ITEMS
+from utils.history import compact, summary_item
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+# One client (and HTTP connection pool) shared by every session in the process
+_supabase: Optional["Client"] = None
+
+
+def get_supabase_client() -> "Client":
+    """Return the process-wide Supabase client, creating it on first use."""
+    global _supabase
+    if _supabase is None:
+        # the supabase SDK is slow to import, so it is only loaded when needed
+        from supabase import create_client
+
+        _supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _supabase
 
 
 class SupabaseSession(Session):
     """Supabase (PostgreSQL-based) implementation of session storage.
 
     Stores conversation history in Supabase.
+
+    With ``write_behind=True`` items passed to ``add_items`` are buffered in
+    memory and only written by ``flush()``, as one insert plus one metadata
+    update. The caller must call ``flush()`` once the run is over.
+
+    History is compacted: ``get_items()`` returns a rolling summary of older
+    turns followed by a token-budgeted window of recent items. The summary and
+    the id of the first item in the window are stored on the session row and
+    updated together with ``updated_at`` whenever items are added.
     """
 
+    # session ids whose row is known to exist, shared across requests
+    _known_sessions: set[str] = set()
+
     def __init__(
         self,
         session_id: str,
         sessions_table: str = "agent_sessions",
         messages_table: str = "agent_messages",
+        write_behind: bool = False,
     ):
         """Initialize the Supabase session.
 
@@ -24,16 +55,20 @@ class SupabaseSession(Session):
             session_id: Unique identifier for the conversation session.
             sessions_table: Table for session metadata (default: 'agent_sessions').
             messages_table: Table for message data (default: 'agent_messages').
+            write_behind: Buffer added items until ``flush()`` (default: False).
         """
         self.session_id = session_id
         self.sessions_table = sessions_table
         self.messages_table = messages_table
-        self.supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        self._initialized = False  # Flag to track initialization
+        self.write_behind = write_behind
+        self.supabase: "Client" = get_supabase_client()
+        self._pending: List[TResponseInputItem] = []  # buffered, not yet written
+        self._window: Optional[list[tuple[int, TResponseInputItem]]] = None
+        self._summary = ""
 
     async def _ensure_session_exists(self) -> None:
         """Ensure the session row exists."""
-        if self._initialized:
+        if self.session_id in self._known_sessions:
             return
 
         def sync_ensure():
@@ -41,13 +76,68 @@ class SupabaseSession(Session):
                 {"session_id": self.session_id}
             ).execute()
 
-        await asyncio.to_thread(sync_ensure)
-        self._initialized = True
+        metrics.inc("supabase_round_trips_total", 1, op="ensure")
+        with metrics.timer("supabase_seconds", op="ensure"):
+            await asyncio.to_thread(sync_ensure)
+        self._known_sessions.add(self.session_id)
+
+    async def _load_window(self) -> None:
+        """Fetch the stored summary and the items of the recent window."""
+        if self._window is not None:
+            return
+        await self._ensure_session_exists()
+
+        def sync_load():
+            try:
+                row = (
+                    self.supabase.table(self.sessions_table)
+                    .select("summary, window_start_id")
+                    .eq("session_id", self.session_id)
+                    .limit(1)
+                    .execute()
+                )
+                meta = row.data[0] if row.data else {}
+                query = (
+                    self.supabase.table(self.messages_table)
+                    .select("id, message_data")
+                    .eq("session_id", self.session_id)
+                )
+                if meta.get("window_start_id"):
+                    query = query.gte("id", meta["window_start_id"])
+                response = (
+                    query.order("id", desc=True).limit(HISTORY_MAX_ITEMS).execute()
+                )
+                window = [(r["id"], r["message_data"]) for r in response.data]
+                return meta.get("summary") or "", list(reversed(window))
+            except Exception as e:
+                print(f"[Supabase Error] Failed to load history window: {e}")
+                return "", []
+
+        metrics.inc("supabase_round_trips_total", 2, op="load_window")
+        with metrics.timer("supabase_seconds", op="load_window"):
+            self._summary, window = await asyncio.to_thread(sync_load)
+        self._window, self._summary, _ = compact(window, self._summary)
 
     async def get_items(self, limit: Optional[int] = None) -> List[TResponseInputItem]:
-        """Retrieve the conversation history for this session."""
+        """Retrieve the conversation history for this session.
+
+        Without a limit this is the summary of older turns (if any) followed by
+        the recent window. With a limit it is the latest ``limit`` items.
+        """
         await self._ensure_session_exists()
 
+        if not limit:
+            await self._load_window()
+            items = [item for _, item in self._window] + self._pending
+            if self._summary:
+                items.insert(0, summary_item(self._summary))
+            return items
+
+        pending = self._pending[-limit:]
+        if len(pending) >= limit:
+            return pending
+        stored_limit = limit - len(pending)
+
         def sync_get():
             try:
                 query = (
@@ -56,9 +146,8 @@ class SupabaseSession(Session):
                     .eq("session_id", self.session_id)
                     .order("created_at", desc=True)
                     .order("id", desc=True)
+                    .limit(stored_limit)
                 )
-                if limit:
-                    query = query.limit(limit)
                 response = query.execute()
                 items = [item["message_data"] for item in response.data]
                 # print("Retrieved items:", list(reversed(items)))
@@ -67,13 +156,28 @@ class SupabaseSession(Session):
                 print(f"[Supabase Error] Failed to get items: {e}")
                 return []
 
-        return await asyncio.to_thread(sync_get)
+        metrics.inc("supabase_round_trips_total", 1, op="get_items")
+        with metrics.timer("supabase_seconds", op="get_items"):
+            return await asyncio.to_thread(sync_get) + pending
 
     async def add_items(self, items: List[TResponseInputItem]) -> None:
         """Add new items to the conversation history."""
         if not items:
             return
-        await self._ensure_session_exists()  # Ensure initialized
+        if self.write_behind:
+            self._pending.extend(items)
+            return
+        await self._write(items)
+
+    async def flush(self) -> None:
+        """Write all buffered items in one insert plus one metadata update."""
+        if not self._pending:
+            return
+        items, self._pending = self._pending, []
+        await self._write(items)
+
+    async def _write(self, items: List[TResponseInputItem]) -> None:
+        await self._load_window()  # Ensure initialized, window known
 
         def sync_add():
             try:
@@ -81,45 +185,78 @@ class SupabaseSession(Session):
                     {"session_id": self.session_id, "message_data": item}
                     for item in items
                 ]
-                self.supabase.table(self.messages_table).insert(data).execute()
-                self.supabase.table(self.sessions_table).update(
-                    {"updated_at": "now()"}
-                ).eq("session_id", self.session_id).execute()
+                inserted = (
+                    self.supabase.table(self.messages_table).insert(data).execute()
+                )
+                self._window.extend(
+                    (row["id"], row["message_data"]) for row in inserted.data
+                )
+                self._window, self._summary, _ = compact(self._window, self._summary)
+                meta = {"updated_at": "now()", "summary": self._summary}
+                if self._window:
+                    meta["window_start_id"] = self._window[0][0]
+                self.supabase.table(self.sessions_table).update(meta).eq(
+                    "session_id", self.session_id
+                ).execute()
             except Exception as e:
                 print(f"[Supabase Error] Failed to add items: {e}")
                 return []
 
-        await asyncio.to_thread(sync_add)
+        metrics.inc("supabase_round_trips_total", 2, op="add_items")
+        with metrics.timer("supabase_seconds", op="add_items"):
+            await asyncio.to_thread(sync_add)
 
     async def pop_item(self) -> Optional[TResponseInputItem]:
-        """Remove and return the most recent item from the session."""
+        """Remove and return the most recent item from the session.
+
+        Once the window is loaded the id of the latest item is known, so this
+        is a single delete that returns the deleted row.
+        """
+        if self._pending:
+            return self._pending.pop()
         await self._ensure_session_exists()  # Ensure initialized
+        if self._window is not None and not self._window:
+            return None
+        known_id = self._window[-1][0] if self._window else None
 
         def sync_pop():
             try:
-                latest = (
+                latest_id = known_id
+                if latest_id is None:
+                    latest = (
+                        self.supabase.table(self.messages_table)
+                        .select("id")
+                        .eq("session_id", self.session_id)
+                        .order("id", desc=True)
+                        .limit(1)
+                        .execute()
+                    )
+                    if not latest.data:
+                        return None
+                    latest_id = latest.data[0]["id"]
+                deleted = (
                     self.supabase.table(self.messages_table)
-                    .select("id, message_data")
-                    .eq("session_id", self.session_id)
-                    .order("created_at", desc=True)
-                    .limit(1)
+                    .delete()
+                    .eq("id", latest_id)
                     .execute()
                 )
-                if not latest.data:
-                    return None
-                item = latest.data[0]["message_data"]
-                self.supabase.table(self.messages_table).delete().eq(
-                    "id", latest.data[0]["id"]
-                ).execute()
-                return item
+                return deleted.data[0]["message_data"] if deleted.data else None
             except Exception as e:
                 print(f"[Supabase Error] Failed to pop item: {e}")
-                return []
+                return None
 
-        return await asyncio.to_thread(sync_pop)
+        metrics.inc("supabase_round_trips_total", 1 if known_id else 2, op="pop_item")
+        with metrics.timer("supabase_seconds", op="pop_item"):
+            item = await asyncio.to_thread(sync_pop)
+        if item is not None and self._window:
+            self._window.pop()
+        return item
 
     async def clear_session(self) -> None:
         """Clear all items for this session."""
+        self._pending.clear()
+        self._window = None
+        self._summary = ""
         await self._ensure_session_exists()  # Ensure initialized
 
         def sync_clear():
@@ -130,8 +267,11 @@ class SupabaseSession(Session):
                 self.supabase.table(self.sessions_table).delete().eq(
                     "session_id", self.session_id
                 ).execute()
+                self._known_sessions.discard(self.session_id)
             except Exception as e:
                 print(f"[Supabase Error] Failed to clear session: {e}")
                 return []
 
-        await asyncio.to_thread(sync_clear)
+        metrics.inc("supabase_round_trips_total", 2, op="clear_session")
+        with metrics.timer("supabase_seconds", op="clear_session"):
+            await asyncio.to_thread(sync_clear)
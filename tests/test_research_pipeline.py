@@ -0,0 +1,32 @@
+from high_level_agents.research_pipeline import revision
+
+
+def apply(report: str, revised: str) -> str:
+    event = revision(report, revised)
+    return report[: event.offset] + event.data
+
+
+def test_revision_appended_paragraph():
+    event = revision("a\n\nb", "a\n\nb\n\nc")
+    assert event.offset == 3
+    assert apply("a\n\nb", "a\n\nb\n\nc") == "a\n\nb\n\nc"
+
+
+def test_revision_truncated_report():
+    assert apply("a\n\nb\n\nc", "a\n\nb") == "a\n\nb"
+
+
+def test_revision_middle_edit():
+    report = "# Title\n\nfirst\n\nsecond\n\nthird"
+    revised = "# Title\n\nfirst\n\nsecond, fixed\n\nthird"
+    event = revision(report, revised)
+    assert event.offset == report.index("second")
+    assert apply(report, revised) == revised
+
+
+def test_revision_from_first_paragraph():
+    assert apply("alpha\n\nbeta", "alpha, revised\n\nbeta") == "alpha, revised\n\nbeta"
+
+
+def test_revision_unchanged():
+    assert revision("a\n\nb", "a\n\nb\n") is None
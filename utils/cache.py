@@ -0,0 +1,187 @@
+import asyncio, json, os, sqlite3, threading, time
+from collections import OrderedDict
+from typing import Any, Optional
+from utils import metrics
+from utils.config import CACHE_DB_PATH, CACHE_DISK_MAX_MB, CACHE_MEMORY_ENTRIES
+
+
+class TTLCache:
+    """Two-tier cache: an in-process LRU in front of an on-disk SQLite store.
+
+    Every entry carries its own expiry. Values must be JSON serializable.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        ttl: int,
+        max_entries: int = CACHE_MEMORY_ENTRIES,
+        max_disk_bytes: int = CACHE_DISK_MAX_MB * 1024 * 1024,
+        db_path: Optional[str] = CACHE_DB_PATH,
+    ):
+        """Initialize the cache.
+
+        Args:
+            namespace: Name separating this cache's keys from other caches in the same file.
+            ttl: Time to live of an entry, in seconds.
+            max_entries: Maximum number of entries kept in memory.
+            max_disk_bytes: Size cap of this namespace on disk; least recently used entries go first.
+            db_path: SQLite file path. ``None`` keeps the cache in memory only.
+        """
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.db_path = db_path
+        self._memory: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+        self.evictions = 0
+
+    # ---------- disk tier ----------
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS cache_entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )"""
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS cache_entries_lru ON cache_entries (namespace, accessed_at)"
+            )
+        return self._db
+
+    def _disk_get(self, key: str) -> Optional[tuple[Any, float]]:
+        now = time.time()
+        with self._db_lock:
+            db = self._connect()
+            row = db.execute(
+                "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                db.execute(
+                    "DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+                    (self.namespace, key),
+                )
+                db.commit()
+                return None
+            db.execute(
+                "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                (now, self.namespace, key),
+            )
+            db.commit()
+        return json.loads(row[0]), row[1]
+
+    def _disk_set(self, key: str, payload: str, expires_at: float) -> None:
+        now = time.time()
+        with self._db_lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO cache_entries VALUES (?, ?, ?, ?, ?, ?)",
+                (self.namespace, key, payload, len(payload), expires_at, now),
+            )
+            db.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND expires_at <= ?",
+                (self.namespace, now),
+            )
+            total = db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ?",
+                (self.namespace,),
+            ).fetchone()[0]
+            while total > self.max_disk_bytes:
+                oldest = db.execute(
+                    "SELECT key, size FROM cache_entries WHERE namespace = ? ORDER BY accessed_at LIMIT 1",
+                    (self.namespace,),
+                ).fetchone()
+                if oldest is None:
+                    break
+                db.execute(
+                    "DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+                    (self.namespace, oldest[0]),
+                )
+                total -= oldest[1]
+                self.evictions += 1
+            db.commit()
+
+    # ---------- memory tier ----------
+
+    def _memory_set(self, key: str, value: Any, expires_at: float) -> None:
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    # ---------- public API ----------
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None if missing or expired."""
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.time():
+                self._memory.move_to_end(key)
+                self.hits["memory"] += 1
+                metrics.inc("cache_lookups_total", cache=self.namespace, result="memory_hit")
+                return value
+            del self._memory[key]
+
+        if self.db_path:
+            try:
+                found = await asyncio.to_thread(self._disk_get, key)
+            except sqlite3.Error as e:
+                print(f"[Cache Error] Failed to read {self.namespace}: {e}")
+                found = None
+            if found is not None:
+                value, expires_at = found
+                self._memory_set(key, value, expires_at)
+                self.hits["disk"] += 1
+                metrics.inc("cache_lookups_total", cache=self.namespace, result="disk_hit")
+                return value
+
+        self.misses += 1
+        metrics.inc("cache_lookups_total", cache=self.namespace, result="miss")
+        return None
+
+    async def set(self, key: str, value: Any) -> None:
+        """Store value under key in both tiers."""
+        expires_at = time.time() + self.ttl
+        self._memory_set(key, value, expires_at)
+        if self.db_path:
+            try:
+                await asyncio.to_thread(
+                    self._disk_set, key, json.dumps(value), expires_at
+                )
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                print(f"[Cache Error] Failed to write {self.namespace}: {e}")
+
+    def stats(self) -> dict:
+        """Hit/miss counters of this cache."""
+        hits = self.hits["memory"] + self.hits["disk"]
+        lookups = hits + self.misses
+        return {
+            "namespace": self.namespace,
+            "memory_hits": self.hits["memory"],
+            "disk_hits": self.hits["disk"],
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "memory_entries": len(self._memory),
+        }
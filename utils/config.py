@@ -1,4 +1,4 @@
-import os
+import json, os
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -6,31 +6,193 @@ load_dotenv()
 # App settings
 HOST = os.getenv("HOST", "127.0.0.1")
 PORT = int(os.getenv("PORT", 8000))
+# production mode: worker processes (default: one per CPU) and how long a
+# shutdown waits for in-flight streams and jobs to finish
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 0)) or os.cpu_count() or 1
+GRACEFUL_SHUTDOWN_SECONDS = int(os.getenv("GRACEFUL_SHUTDOWN_SECONDS", 90))
 
 # API Keys
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
+TAVILY_BASE_URL = os.getenv("TAVILY_BASE_URL")  # defaults to the public API
 
 # LLM settings
 MODEL = os.getenv("model")
 BASE_URL = os.getenv("BASE_URL")
 
+# Shared LLM connection pool
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 100))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", 20))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", 60))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 10))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 600))
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "false").lower() in ("1", "true", "yes")
+
+# Per-agent model routing: a JSON object mapping a route (guardrail,
+# requirement_gathering, deep_research, query_generator, synthesis, writer,
+# reflection) to {"models": [primary, fallback, ...], "max_tokens",
+# "temperature", "timeout", "max_p95"}. Routes not listed use MODEL.
+MODEL_ROUTES = json.loads(os.getenv("MODEL_ROUTES") or "{}")
+# A model is taken out of its route for ROUTE_COOLDOWN seconds when, over its
+# last ROUTE_WINDOW calls (at least ROUTE_MIN_CALLS), the error rate exceeds
+# ROUTE_MAX_ERROR_RATE or the p95 latency (time to first token when
+# streaming) exceeds the route's max_p95, default ROUTE_MAX_P95 (0 = off)
+ROUTE_WINDOW = int(os.getenv("ROUTE_WINDOW", 50))
+ROUTE_MIN_CALLS = int(os.getenv("ROUTE_MIN_CALLS", 10))
+ROUTE_MAX_ERROR_RATE = float(os.getenv("ROUTE_MAX_ERROR_RATE", 0.25))
+ROUTE_MAX_P95 = float(os.getenv("ROUTE_MAX_P95", 0))
+ROUTE_COOLDOWN = float(os.getenv("ROUTE_COOLDOWN", 60))
+
+# Hedged requests: a Tavily search or non-streamed model call still running at
+# the HEDGE_QUANTILE of its recent latencies gets a backup call (to the next
+# model of the route, if any), first success wins. Backups are capped at
+# HEDGE_BUDGET of the last HEDGE_WINDOW calls.
+HEDGING = os.getenv("HEDGING", "false").lower() in ("1", "true", "yes")
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", 0.95))
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", 0.05))
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", 200))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", 20))
+
 # OpenApi Key
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# Export agent traces to OpenAI (spans always feed /metrics)
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "true").lower() in ("1", "true", "yes")
+# debug: log every agent span with its request id and duration
+METRICS_LOG_SPANS = os.getenv("METRICS_LOG_SPANS", "false").lower() in ("1", "true", "yes")
+
 
 # supabase
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
+# Research mode: "orchestrator" lets the Deep Research Agent drive the stages
+# through tool calls, "pipeline" runs them directly in code
+RESEARCH_MODE = os.getenv("RESEARCH_MODE", "orchestrator")
+# Reflection in pipeline mode: "always", "check" (only when the local check
+# finds issues) or "off"
+RESEARCH_REFLECTION = os.getenv("RESEARCH_REFLECTION", "check")
+
+# Conversation history compaction
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", 6000))
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", 1000))
+HISTORY_MAX_ITEMS = int(os.getenv("HISTORY_MAX_ITEMS", 200))
+
+# Session storage: "supabase", "sqlite" (local database, WAL mode) or "tiered"
+# (local SQLite, written through to Supabase in the background)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "supabase")
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", ".data/sessions.sqlite3")
+# Hot tier: the sessions of the last SESSION_HOT_ENTRIES active users stay in
+# memory with their history window loaded, for SESSION_HOT_TTL idle seconds
+# (0 entries = off; set automatically by `main.py --production` with more
+# than one worker, as a user's turns may land on any of them)
+SESSION_HOT_ENTRIES = int(os.getenv("SESSION_HOT_ENTRIES", 1000))
+SESSION_HOT_TTL = int(os.getenv("SESSION_HOT_TTL", 30 * 60))
+
+# Input guardrail
+GUARDRAIL_CACHE_TTL = int(os.getenv("GUARDRAIL_CACHE_TTL", 24 * 60 * 60))
+
+# Tavily result cache
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", ".cache/research_cache.sqlite3")
+CACHE_MEMORY_ENTRIES = int(os.getenv("CACHE_MEMORY_ENTRIES", 512))
+CACHE_DISK_MAX_MB = int(os.getenv("CACHE_DISK_MAX_MB", 256))
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", 6 * 60 * 60))
+EXTRACT_CACHE_TTL = int(os.getenv("EXTRACT_CACHE_TTL", 24 * 60 * 60))
+
+# Local research corpus: extracted pages in an FTS5 index, searched before
+# Tavily. A query with CORPUS_MIN_HITS fresh pages containing CORPUS_MIN_MATCH
+# of its terms is not searched on the web. CORPUS_MAX_MB=0 disables it.
+CORPUS_MAX_AGE = int(os.getenv("CORPUS_MAX_AGE", 7 * 24 * 60 * 60))
+CORPUS_MAX_MB = int(os.getenv("CORPUS_MAX_MB", 200))
+CORPUS_MIN_MATCH = float(os.getenv("CORPUS_MIN_MATCH", 0.6))
+CORPUS_MIN_HITS = int(os.getenv("CORPUS_MIN_HITS", 3))
+CORPUS_SEARCH_LIMIT = int(os.getenv("CORPUS_SEARCH_LIMIT", 5))
+
+# Finished research report cache
+REPORT_CACHE_THRESHOLD = float(os.getenv("REPORT_CACHE_THRESHOLD", 0.85))
+REPORT_CACHE_TTL = int(os.getenv("REPORT_CACHE_TTL", 7 * 24 * 60 * 60))
+REPORT_CACHE_MAX_ENTRIES = int(os.getenv("REPORT_CACHE_MAX_ENTRIES", 2000))
+
+# Tavily extraction
+EXTRACT_BATCH_SIZE = min(int(os.getenv("EXTRACT_BATCH_SIZE", 5)), 20)  # Tavily max is 20
+EXTRACT_CONCURRENCY = int(os.getenv("EXTRACT_CONCURRENCY", 4))  # adaptive limit ceiling
+EXTRACT_TIMEOUT = int(os.getenv("EXTRACT_TIMEOUT", 20))
+
+# Tavily search -> extract pipeline
+SEARCH_MIN_SCORE = float(os.getenv("SEARCH_MIN_SCORE", 0.8))
+PIPELINE_TARGET_DOCS = int(os.getenv("PIPELINE_TARGET_DOCS", 12))
+PIPELINE_TIME_BUDGET = float(os.getenv("PIPELINE_TIME_BUDGET", 30))
+
+# Request deadline: a /chat turn should be answered within CHAT_DEADLINE
+# seconds of its arrival (0 = no deadline). With less than
+# DEADLINE_RESEARCH_SECONDS left the research degrades in proportion: fewer
+# URLs are extracted and the writer's output budget shrinks from
+# WRITER_MAX_TOKENS (down to DEADLINE_MIN_WRITER_TOKENS). Reflection is
+# skipped with less than DEADLINE_REFLECTION_SECONDS left, and the web search
+# gets at most DEADLINE_SEARCH_SHARE of the time left.
+CHAT_DEADLINE = float(os.getenv("CHAT_DEADLINE", 180))
+DEADLINE_RESEARCH_SECONDS = float(os.getenv("DEADLINE_RESEARCH_SECONDS", 120))
+DEADLINE_REFLECTION_SECONDS = float(os.getenv("DEADLINE_REFLECTION_SECONDS", 45))
+DEADLINE_SEARCH_SHARE = float(os.getenv("DEADLINE_SEARCH_SHARE", 0.25))
+WRITER_MAX_TOKENS = int(os.getenv("WRITER_MAX_TOKENS", 4000))
+DEADLINE_MIN_WRITER_TOKENS = int(os.getenv("DEADLINE_MIN_WRITER_TOKENS", 800))
+
+# Near-duplicate elimination (max differing SimHash bits out of 64)
+DEDUP_DOC_DISTANCE = int(os.getenv("DEDUP_DOC_DISTANCE", 3))
+DEDUP_PARAGRAPH_DISTANCE = int(os.getenv("DEDUP_PARAGRAPH_DISTANCE", 3))
+
+# Passage selection: extracted pages are cut into passages of about
+# PASSAGE_WORDS words, ranked by BM25 against the search queries, and only the
+# best PASSAGE_TOP_K per source (0 = whole pages) are forwarded, within
+# PASSAGE_TOKEN_BUDGET tokens in total
+PASSAGE_WORDS = int(os.getenv("PASSAGE_WORDS", 120))
+PASSAGE_TOP_K = int(os.getenv("PASSAGE_TOP_K", 4))
+PASSAGE_TOKEN_BUDGET = int(os.getenv("PASSAGE_TOKEN_BUDGET", 6000))
+
+# Server-sent event streams (runs outlive their connection and can be resumed)
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", 15))
+SSE_BUFFER_EVENTS = int(os.getenv("SSE_BUFFER_EVENTS", 1000))  # kept in memory per run
+SSE_SPILL_DIR = os.getenv("SSE_SPILL_DIR", ".cache/runs")  # older events, "" to drop them
+SSE_RUN_TTL = int(os.getenv("SSE_RUN_TTL", 10 * 60))  # seconds a finished run stays resumable
+
+# Research jobs: worker pool and admission control
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 8))  # runs executed at the same time
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", 32))  # waiting runs before 503
+JOB_MAX_PER_USER = int(os.getenv("JOB_MAX_PER_USER", 2))  # active runs per uid before 429
+
+# Upstream rate limits, per provider: requests per second (0 = no cap) and
+# the ceiling of the adaptive concurrency limit, which halves on 429s and
+# timeouts and creeps back up while calls succeed under the latency target
+LLM_RATE_LIMIT = float(os.getenv("LLM_RATE_LIMIT", 0))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 32))
+LLM_LATENCY_TARGET = float(os.getenv("LLM_LATENCY_TARGET", 30))  # seconds to response headers
+TAVILY_SEARCH_RATE_LIMIT = float(os.getenv("TAVILY_SEARCH_RATE_LIMIT", 0))
+TAVILY_SEARCH_MAX_CONCURRENCY = int(os.getenv("TAVILY_SEARCH_MAX_CONCURRENCY", 8))
+TAVILY_EXTRACT_RATE_LIMIT = float(os.getenv("TAVILY_EXTRACT_RATE_LIMIT", 0))
+TAVILY_LATENCY_TARGET = float(os.getenv("TAVILY_LATENCY_TARGET", 15))
+# Retries of rate limited or overloaded calls (jittered exponential backoff,
+# or the provider's Retry-After when it sends one)
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", 4))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", 0.5))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", 20))
+# keep the limiter state in the cache database so worker processes share it
+# (set automatically by `main.py --production` with more than one worker)
+RATE_LIMIT_SHARED = os.getenv("RATE_LIMIT_SHARED", "false").lower() in ("1", "true", "yes")
+
 
 required_vars = {
     "GOOGLE_API_KEY": GOOGLE_API_KEY,
     "model": MODEL,
     "OPENAI_API_KEY": OPENAI_API_KEY,
-    "SUPABASE_URL": SUPABASE_URL,
-    "SUPABASE_KEY": SUPABASE_KEY,
+    "TAVILY_API_KEY": TAVILY_API_KEY,
 }
-missing = [k for k, v in required_vars.items() if not v]
-if missing:
-    raise RuntimeError(f"Missing required environment variables: {missing}")
+# the sqlite session backend keeps the history without Supabase
+if SESSION_BACKEND in ("supabase", "tiered"):
+    required_vars.update({"SUPABASE_URL": SUPABASE_URL, "SUPABASE_KEY": SUPABASE_KEY})
+
+
+def validate_config() -> None:
+    """Fail fast when a required setting is missing; called at server startup."""
+    missing = [k for k, v in required_vars.items() if not v]
+    if missing:
+        raise RuntimeError(f"Missing required environment variables: {missing}")
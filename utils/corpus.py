@@ -0,0 +1,190 @@
+import asyncio, os, sqlite3, threading, time
+from typing import Optional
+from utils import metrics
+from utils.text import tokenize
+from utils.urls import canonicalize_url
+from utils.config import (
+    CACHE_DB_PATH,
+    CORPUS_MAX_AGE,
+    CORPUS_MAX_MB,
+    CORPUS_MIN_MATCH,
+    CORPUS_SEARCH_LIMIT,
+)
+
+
+class ResearchCorpus:
+    """Every page extracted from the web, kept in a SQLite FTS5 index.
+
+    A search returns the fresh pages (fetched less than max_age seconds ago)
+    that contain at least min_match of the query's terms, scored by that
+    fraction. Pages older than max_age are no longer returned and are
+    replaced when the web returns them again; the least recently used pages
+    are evicted once the corpus grows past max_bytes.
+    """
+
+    def __init__(
+        self,
+        max_age: int = CORPUS_MAX_AGE,
+        max_bytes: int = CORPUS_MAX_MB * 1024 * 1024,
+        min_match: float = CORPUS_MIN_MATCH,
+        db_path: str = CACHE_DB_PATH,
+    ):
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.min_match = min_match
+        self.db_path = db_path
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS corpus_pages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    key TEXT NOT NULL UNIQUE,
+                    url TEXT NOT NULL,
+                    title TEXT,
+                    size INTEGER NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            self._db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS corpus_text USING fts5(title, content)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS corpus_pages_lru ON corpus_pages (accessed_at)"
+            )
+        return self._db
+
+    def _search(self, query: str, limit: int) -> list[dict]:
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        now = time.time()
+        db = self._connect()
+        rows = db.execute(
+            """SELECT p.id, p.url, p.title, t.content, p.fetched_at
+               FROM corpus_text t JOIN corpus_pages p ON p.id = t.rowid
+               WHERE corpus_text MATCH ? AND p.fetched_at > ?
+               ORDER BY bm25(corpus_text) LIMIT ?""",
+            (" OR ".join(f'"{term}"' for term in terms), now - self.max_age, limit * 4),
+        ).fetchall()
+        pages = []
+        for page_id, url, title, content, fetched_at in rows:
+            match = len(terms & set(tokenize(f"{title or ''} {content}"))) / len(terms)
+            if match >= self.min_match:
+                pages.append(
+                    {
+                        "id": page_id,
+                        "url": url,
+                        "title": title,
+                        "score": match,
+                        "raw_content": content,
+                        "fetched_at": fetched_at,
+                    }
+                )
+        pages.sort(key=lambda page: page["score"], reverse=True)
+        pages = pages[:limit]
+        db.executemany(
+            "UPDATE corpus_pages SET accessed_at = ? WHERE id = ?",
+            [(now, page.pop("id")) for page in pages],
+        )
+        db.commit()
+        return pages
+
+    def _add(self, pages: list[dict]) -> None:
+        now = time.time()
+        db = self._connect()
+        for page in pages:
+            content = page.get("raw_content") or ""
+            if not content:
+                continue
+            key = canonicalize_url(page["url"])
+            old = db.execute("SELECT id FROM corpus_pages WHERE key = ?", (key,)).fetchone()
+            if old:
+                db.execute("DELETE FROM corpus_text WHERE rowid = ?", old)
+                db.execute("DELETE FROM corpus_pages WHERE id = ?", old)
+            cursor = db.execute(
+                "INSERT INTO corpus_pages (key, url, title, size, fetched_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, page["url"], page.get("title"), len(content), now, now),
+            )
+            db.execute(
+                "INSERT INTO corpus_text (rowid, title, content) VALUES (?, ?, ?)",
+                (cursor.lastrowid, page.get("title") or "", content),
+            )
+        self._evict(db, now)
+        db.commit()
+
+    def _evict(self, db: sqlite3.Connection, now: float) -> None:
+        """Drop stale pages, then the least recently used ones beyond the size cap."""
+        expired = db.execute(
+            "SELECT id FROM corpus_pages WHERE fetched_at <= ?", (now - self.max_age,)
+        ).fetchall()
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM corpus_pages").fetchone()[0]
+        if total > self.max_bytes:
+            dropped = {page_id for (page_id,) in expired}
+            for page_id, size in db.execute(
+                "SELECT id, size FROM corpus_pages ORDER BY accessed_at"
+            ).fetchall():
+                if total <= self.max_bytes:
+                    break
+                if page_id not in dropped:
+                    expired.append((page_id,))
+                total -= size
+        db.executemany("DELETE FROM corpus_text WHERE rowid = ?", expired)
+        db.executemany("DELETE FROM corpus_pages WHERE id = ?", expired)
+        self.evictions += len(expired)
+
+    def _locked(self, fn, *args):
+        with self._lock:
+            return fn(*args)
+
+    async def search(self, query: str, limit: int = CORPUS_SEARCH_LIMIT) -> list[dict]:
+        """Fresh pages matching the query, best match first (url, title, score, raw_content)."""
+        if not self.enabled:
+            return []
+        try:
+            pages = await asyncio.to_thread(self._locked, self._search, query, limit)
+        except sqlite3.Error as e:
+            print(f"[Corpus Error] Failed to search: {e}")
+            pages = []
+        if pages:
+            self.hits += 1
+        else:
+            self.misses += 1
+        metrics.inc("cache_lookups_total", cache="research_corpus", result="hit" if pages else "miss")
+        return pages
+
+    async def add(self, pages: list[dict]) -> None:
+        """Store freshly extracted pages (url, title, raw_content), replacing older copies."""
+        if not self.enabled or not pages:
+            return
+        try:
+            await asyncio.to_thread(self._locked, self._add, pages)
+        except sqlite3.Error as e:
+            print(f"[Corpus Error] Failed to store pages: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+corpus = ResearchCorpus()
@@ -0,0 +1,77 @@
+import math, time
+from typing import Optional
+from agents import Agent, ModelSettings
+from logger_colors import BLUE, RESET
+from utils import metrics
+from utils.config import (
+    PIPELINE_TARGET_DOCS,
+    PIPELINE_TIME_BUDGET,
+    DEADLINE_RESEARCH_SECONDS,
+    DEADLINE_REFLECTION_SECONDS,
+    DEADLINE_SEARCH_SHARE,
+    WRITER_MAX_TOKENS,
+    DEADLINE_MIN_WRITER_TOKENS,
+)
+
+MIN_TARGET_DOCS = 3  # sources extracted however short the time
+
+
+class Deadline:
+    """Wall-clock budget of one request, carried on the run context.
+
+    Set when the request arrives; stages read the time left and cut their
+    work down as it runs out rather than overrun it, noting it in degraded.
+    A budget of 0 seconds means no deadline.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds if seconds > 0 else math.inf
+        self.degraded: set[str] = set()  # stages cut down so far
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def share(self, full: float = DEADLINE_RESEARCH_SECONDS) -> float:
+        """Time left as a fraction of full: 1.0 while at least full seconds remain."""
+        if full <= 0:
+            return 1.0
+        return min(1.0, self.remaining() / full)
+
+
+def _degraded(deadline: Deadline, stage: str, detail: str) -> None:
+    deadline.degraded.add(stage)
+    print(f"{BLUE} Deadline: {stage} cut down ({detail}) {RESET}")
+    metrics.inc("deadline_degradations_total", stage=stage)
+
+
+def search_limits(deadline: Optional[Deadline]) -> tuple[int, float]:
+    """target_docs and time_budget of the search and extract stage."""
+    if deadline is None:
+        return PIPELINE_TARGET_DOCS, PIPELINE_TIME_BUDGET
+    share = deadline.share()
+    target_docs = max(MIN_TARGET_DOCS, round(PIPELINE_TARGET_DOCS * share))
+    time_budget = min(PIPELINE_TIME_BUDGET, deadline.remaining() * DEADLINE_SEARCH_SHARE)
+    if share < 1 or time_budget < PIPELINE_TIME_BUDGET:
+        _degraded(deadline, "search", f"{target_docs} documents in {time_budget:.0f}s")
+    return target_docs, time_budget
+
+
+def skip_reflection(deadline: Optional[Deadline]) -> bool:
+    """Whether too little time is left for the reflection pass."""
+    if deadline is None or deadline.remaining() >= DEADLINE_REFLECTION_SECONDS:
+        return False
+    _degraded(deadline, "reflection", f"{deadline.remaining():.0f}s left")
+    return True
+
+
+def budgeted_writer(writer: Agent, deadline: Optional[Deadline]) -> Agent:
+    """The writer agent, with a smaller output budget when time runs short."""
+    if deadline is None or deadline.share() >= 1:
+        return writer
+    max_tokens = max(DEADLINE_MIN_WRITER_TOKENS, int(WRITER_MAX_TOKENS * deadline.share()))
+    _degraded(deadline, "writer", f"max {max_tokens} tokens")
+    return writer.clone(model_settings=writer.model_settings.resolve(ModelSettings(max_tokens=max_tokens)))
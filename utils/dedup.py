@@ -0,0 +1,111 @@
+import hashlib, re
+from utils.config import DEDUP_DOC_DISTANCE, DEDUP_PARAGRAPH_DISTANCE
+
+WORD_RE = re.compile(r"\w+")
+SHINGLE_SIZE = 3
+MIN_SIMHASH_WORDS = 8  # shorter paragraphs are only deduplicated exactly
+
+
+def _hash64(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "big")
+
+
+def simhash(words: list[str]) -> int:
+    """64-bit SimHash fingerprint over word shingles."""
+    shingles = [
+        " ".join(words[i : i + SHINGLE_SIZE])
+        for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))
+    ]
+    weights = [0] * 64
+    for shingle in shingles:
+        h = _hash64(shingle)
+        for bit in range(64):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+class SimHashIndex:
+    """Finds fingerprints within max_distance bits of each other.
+
+    Fingerprints are split into max_distance + 1 bands; two fingerprints that
+    differ in at most max_distance bits share at least one band exactly, so
+    only fingerprints in the same band bucket need to be compared.
+    """
+
+    def __init__(self, max_distance: int):
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.band_bits = 64 // self.bands
+        self.buckets: dict[tuple[int, int], list[tuple[int, object]]] = {}
+
+    def _keys(self, fingerprint: int):
+        mask = (1 << self.band_bits) - 1
+        for band in range(self.bands):
+            yield band, fingerprint >> (band * self.band_bits) & mask
+
+    def find(self, fingerprint: int):
+        """Return the value stored with a near-duplicate fingerprint, or None."""
+        for key in self._keys(fingerprint):
+            for other, value in self.buckets.get(key, []):
+                if (fingerprint ^ other).bit_count() <= self.max_distance:
+                    return value
+        return None
+
+    def add(self, fingerprint: int, value) -> None:
+        for key in self._keys(fingerprint):
+            self.buckets.setdefault(key, []).append((fingerprint, value))
+
+
+def dedupe_documents(documents: list[dict]) -> list[dict]:
+    """Drop near-duplicate documents and repeated paragraphs.
+
+    Documents are visited best score first. A document whose content is a
+    near duplicate of one already kept is dropped and its url is added to the
+    kept copy's ``sources``. Paragraphs already seen in a kept document are
+    removed from later ones. Documents without any words (empty or failed
+    extractions) are dropped, as they would all share one fingerprint.
+    """
+    doc_index = SimHashIndex(DEDUP_DOC_DISTANCE)
+    paragraph_index = SimHashIndex(DEDUP_PARAGRAPH_DISTANCE)
+    seen_paragraphs = set()
+    kept = []
+    chars_before = chars_after = 0
+
+    for doc in sorted(documents, key=lambda d: d.get("score", 0), reverse=True):
+        content = doc.get("raw_content") or ""
+        chars_before += len(content)
+        words = WORD_RE.findall(content.lower())
+        if not words:
+            continue
+        fingerprint = simhash(words)
+        original = doc_index.find(fingerprint)
+        if original is not None:
+            original["sources"].append(doc["url"])
+            continue
+
+        paragraphs = []
+        for paragraph in re.split(r"\n\s*\n", content):
+            paragraph_words = WORD_RE.findall(paragraph.lower())
+            if not paragraph_words:
+                continue
+            exact = " ".join(paragraph_words)
+            if exact in seen_paragraphs:
+                continue
+            seen_paragraphs.add(exact)
+            if len(paragraph_words) >= MIN_SIMHASH_WORDS:
+                paragraph_fingerprint = simhash(paragraph_words)
+                if paragraph_index.find(paragraph_fingerprint) is not None:
+                    continue
+                paragraph_index.add(paragraph_fingerprint, True)
+            paragraphs.append(paragraph.strip())
+
+        doc = {**doc, "raw_content": "\n\n".join(paragraphs), "sources": [doc["url"]]}
+        doc_index.add(fingerprint, doc)
+        chars_after += len(doc["raw_content"])
+        kept.append(doc)
+
+    print(
+        f"[Dedup] kept {len(kept)} of {len(documents)} documents, "
+        f"{chars_after} of {chars_before} characters"
+    )
+    return kept
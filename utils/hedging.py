@@ -0,0 +1,108 @@
+import asyncio, time
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+from utils import metrics
+from utils.config import (
+    HEDGING,
+    HEDGE_QUANTILE,
+    HEDGE_BUDGET,
+    HEDGE_WINDOW,
+    HEDGE_MIN_SAMPLES,
+)
+
+
+class Hedger:
+    """Issues a backup call when the first one is slower than usual.
+
+    If the call has not finished by the HEDGE_QUANTILE of its recent
+    latencies, a second call is started (the backup, or the same call
+    again); the first to succeed wins and the other one is cancelled.
+    Backups are capped at HEDGE_BUDGET of the recent calls, so upstream
+    volume only rises by that fraction.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._latencies: deque[float] = deque(maxlen=HEDGE_WINDOW)
+        self._recent: deque[bool] = deque(maxlen=HEDGE_WINDOW)  # was the call hedged
+        self.calls = 0
+        self.hedged = 0
+        self.wins = 0
+        _hedgers.append(self)
+
+    def delay(self) -> Optional[float]:
+        """How long to wait before hedging, None while there is too little history."""
+        if len(self._latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * HEDGE_QUANTILE))]
+
+    def _within_budget(self) -> bool:
+        return sum(self._recent) + 1 <= HEDGE_BUDGET * len(self._recent)
+
+    async def _timed(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        started = time.monotonic()
+        result = await fn()
+        self._latencies.append(time.monotonic() - started)
+        return result
+
+    async def call(
+        self,
+        fn: Callable[[], Awaitable[Any]],
+        backup: Optional[Callable[[], Awaitable[Any]]] = None,
+    ) -> Any:
+        """Return fn(), hedged with backup() (default fn) if it is slow."""
+        self.calls += 1
+        delay = self.delay() if HEDGING else None
+        if delay is None:
+            self._recent.append(False)
+            return await self._timed(fn)
+
+        primary = asyncio.create_task(self._timed(fn))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or not self._within_budget():
+                if not done:
+                    metrics.inc("hedged_calls_total", group=self.name, result="over_budget")
+                self._recent.append(False)
+                return await primary
+
+            self._recent.append(True)
+            self.hedged += 1
+            metrics.inc("hedged_calls_total", group=self.name, result="issued")
+            hedge = asyncio.create_task(self._timed(backup or fn))
+            tasks.add(hedge)
+            while True:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                # the first success wins; a failure only counts once both failed
+                succeeded = [task for task in done if task.exception() is None]
+                if succeeded:
+                    if hedge in succeeded and primary not in succeeded:
+                        self.wins += 1
+                        metrics.inc("hedged_calls_total", group=self.name, result="won")
+                    return succeeded[0].result()
+                if not tasks:
+                    return primary.result()
+        finally:
+            for task in (primary, *tasks):
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> dict:
+        delay = self.delay()
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "wins": self.wins,
+            "delay": round(delay, 3) if delay is not None else None,
+        }
+
+
+_hedgers: list[Hedger] = []
+
+
+def hedge_stats() -> list[dict]:
+    """Hedged and won counts of every hedged call site."""
+    return [hedger.stats() for hedger in _hedgers]
@@ -0,0 +1,74 @@
+import json
+from typing import Any
+from utils.config import HISTORY_TOKEN_BUDGET, HISTORY_SUMMARY_TOKENS
+
+SUMMARY_LINE_CHARS = 240  # how much of one folded item goes into the summary
+
+
+def estimate_tokens(item: Any) -> int:
+    """Rough token count of a history item (about 4 characters per token)."""
+    return len(json.dumps(item, ensure_ascii=False)) // 4 + 1
+
+
+def _text_of(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(
+            part.get("text", "") for part in content if isinstance(part, dict)
+        )
+    return ""
+
+
+def describe_item(item: dict) -> str:
+    """One summary line for a history item that leaves the window."""
+    kind = item.get("type")
+    if kind == "function_call":
+        line = f"tool call {item.get('name')}({item.get('arguments', '')})"
+    elif kind == "function_call_output":
+        line = f"tool result: {item.get('output', '')}"
+    else:
+        line = f"{item.get('role', kind)}: {_text_of(item.get('content'))}"
+    line = " ".join(line.split())
+    if len(line) > SUMMARY_LINE_CHARS:
+        line = line[: SUMMARY_LINE_CHARS - 3] + "..."
+    return line
+
+
+def compact(
+    window: list[tuple[int, dict]],
+    summary: str,
+    token_budget: int = HISTORY_TOKEN_BUDGET,
+    summary_tokens: int = HISTORY_SUMMARY_TOKENS,
+) -> tuple[list[tuple[int, dict]], str, bool]:
+    """Fold the oldest items of window into summary until it fits token_budget.
+
+    window holds (id, item) pairs in chronological order. A tool result is
+    never left at the head of the window without its tool call. The summary
+    keeps its most recent lines within summary_tokens.
+
+    Returns:
+        The new window, the new summary and whether anything changed.
+    """
+    total = sum(estimate_tokens(item) for _, item in window)
+    lines = summary.splitlines() if summary else []
+    changed = False
+    while len(window) > 1 and (
+        total > token_budget or window[0][1].get("type") == "function_call_output"
+    ):
+        _, item = window.pop(0)
+        total -= estimate_tokens(item)
+        lines.append(describe_item(item))
+        changed = True
+
+    while lines and sum(len(line) for line in lines) > summary_tokens * 4:
+        lines.pop(0)
+    return window, "\n".join(lines), changed
+
+
+def summary_item(summary: str) -> dict:
+    """History item carrying the summary of the turns outside the window."""
+    return {
+        "role": "system",
+        "content": f"Summary of the earlier conversation with this user:\n{summary}",
+    }
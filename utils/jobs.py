@@ -0,0 +1,207 @@
+import asyncio, json, math, time
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Optional
+from logger_colors import BLUE, RED, RESET
+from utils import metrics
+from utils.config import JOB_MAX_PER_USER, JOB_QUEUE_SIZE, JOB_WORKERS
+from utils.sse import RunLog, RunRegistry, runs
+
+
+class JobRejected(Exception):
+    """A job was not admitted; status_code is 429 (per user) or 503 (server full)."""
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+@dataclass
+class Job:
+    """One chat turn run by the worker pool, with its output so far for polling."""
+
+    id: str
+    uid: str
+    log: RunLog
+    status: str = "queued"  # queued, running, done or failed
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    output: str = ""
+    progress: Optional[str] = None
+    error: Optional[str] = None
+
+    def record(self, kind: str, data: str) -> None:
+        if kind == "token":
+            self.output += data
+        elif kind == "revise":
+            revision = json.loads(data)
+            self.output = self.output[: revision["offset"]] + revision["text"]
+        elif kind == "progress":
+            self.progress = data
+        elif kind == "error":
+            self.error = data
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": self.progress,
+            "output": self.output,
+            "error": self.error,
+            "last_event_id": self.log.event_id(self.log.last_seq),
+        }
+
+
+class JobManager:
+    """A bounded queue of jobs in front of a fixed pool of async workers.
+
+    At most ``workers`` runs execute at once, ``max_queued`` more may wait,
+    and each user may have ``max_per_user`` queued or running jobs. Anything
+    beyond that is rejected right away, so a burst is turned away instead of
+    piling concurrent pipelines onto the LLM and Tavily quotas. Finished jobs
+    are forgotten once their run expires from the registry.
+    """
+
+    def __init__(
+        self,
+        registry: RunRegistry = runs,
+        workers: int = JOB_WORKERS,
+        max_queued: int = JOB_QUEUE_SIZE,
+        max_per_user: int = JOB_MAX_PER_USER,
+    ):
+        self.registry = registry
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_per_user = max_per_user
+        self.jobs: dict[str, Job] = {}
+        self._active: defaultdict[str, int] = defaultdict(int)  # queued or running, per uid
+        self._finished: deque[Job] = deque()  # in the order they finished
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.run_seconds_total = 0.0
+        self.draining = False
+
+    def _start_workers(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queued)
+            self._tasks = [
+                asyncio.create_task(self._worker()) for _ in range(self.workers)
+            ]
+
+    def _prune(self) -> None:
+        """Drop the finished jobs kept longer than their runs (the registry's ttl)."""
+        cutoff = time.time() - self.registry.ttl
+        while self._finished and self._finished[0].finished_at < cutoff:
+            job = self._finished.popleft()
+            if self.jobs.get(job.id) is job:
+                del self.jobs[job.id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """The job, as long as its run is still kept by the registry."""
+        self._prune()
+        job = self.jobs.get(job_id)
+        if job and self.registry.get(job_id) is None:
+            del self.jobs[job_id]
+            return None
+        return job
+
+    def _retry_after(self, waiting: int) -> int:
+        average = self.run_seconds_total / self.completed if self.completed else 5.0
+        return max(1, math.ceil(average * (waiting + 1) / self.workers))
+
+    def _reject(self, message: str, status_code: int, reason: str) -> None:
+        self.rejected += 1
+        metrics.inc("jobs_rejected_total", reason=reason)
+        waiting = self._queue.qsize() if self._queue else 0
+        raise JobRejected(message, status_code, self._retry_after(waiting))
+
+    async def submit(
+        self,
+        job_id: str,
+        uid: str,
+        events: AsyncIterator[tuple[str, str]],
+        fingerprint: Optional[str] = None,
+    ) -> Job:
+        """Queue a job producing ``events`` or raise JobRejected (fingerprint: see RunLog)."""
+        if self.draining:
+            self._reject("The server is shutting down, please retry shortly.", 503, "shutdown")
+        self._start_workers()
+        self._prune()
+        if self._active[uid] >= self.max_per_user:
+            self._reject("Too many research requests in progress for this user.", 429, "user")
+        if self._queue.full():
+            self._reject("The server is busy, please retry shortly.", 503, "capacity")
+
+        job = Job(job_id, uid, self.registry.create(job_id, owner=uid, fingerprint=fingerprint))
+        self.jobs[job_id] = job
+        self._active[uid] += 1
+        ahead = self._queue.qsize()
+        if self.running + ahead >= self.workers:
+            await job.log.append(
+                "progress", f"Waiting for a free worker (position {ahead + 1} in the queue)"
+            )
+        self._queue.put_nowait((job, events))
+        metrics.inc("jobs_submitted_total")
+        return job
+
+    async def drain(self, timeout: float) -> None:
+        """Stop admitting jobs and wait up to timeout for the queued and running ones."""
+        self.draining = True
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"{RED} {self.running + self._queue.qsize()} jobs unfinished at shutdown {RESET}")
+        for task in self._tasks:
+            task.cancel()
+
+    async def _worker(self) -> None:
+        while True:
+            job, events = await self._queue.get()
+            self.running += 1
+            job.status = "running"
+            job.started_at = time.time()
+            metrics.observe("job_queue_seconds", job.started_at - job.created_at)
+            try:
+                await self.registry.produce(job.log, self._tracked(job, events))
+            finally:
+                self.running -= 1
+                job.finished_at = time.time()
+                job.status = "failed" if job.error else "done"
+                self.completed += 1
+                self._active[job.uid] -= 1
+                if not self._active[job.uid]:
+                    del self._active[job.uid]
+                self._finished.append(job)
+                self.run_seconds_total += job.finished_at - job.started_at
+                metrics.observe("job_run_seconds", job.finished_at - job.started_at)
+                self._queue.task_done()
+                print(f"{BLUE} Job {job.status} {RESET}=>", job.id)
+
+    async def _tracked(self, job: Job, events: AsyncIterator[tuple[str, str]]):
+        async for kind, data in events:
+            job.record(kind, data)
+            yield kind, data
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_queued": self.max_queued,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "kept": len(self.jobs),
+        }
+
+
+job_manager = JobManager()
@@ -0,0 +1,219 @@
+import hashlib, json, time
+import httpx
+from agents import AsyncOpenAI, OpenAIChatCompletionsModel
+from agents.models.interface import ModelTracing
+from utils.rate_limit import GovernedTransport, llm_governor
+from utils.singleflight import SingleFlight
+from utils.config import (
+    GOOGLE_API_KEY,
+    BASE_URL,
+    MODEL,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_KEEPALIVE,
+    LLM_KEEPALIVE_EXPIRY,
+    LLM_CONNECT_TIMEOUT,
+    LLM_TIMEOUT,
+    LLM_HTTP2,
+)
+
+# One HTTP connection pool shared by every agent talking to BASE_URL
+_http_client: httpx.AsyncClient | None = None
+_client: AsyncOpenAI | None = None
+_models: dict[str, OpenAIChatCompletionsModel] = {}
+_stats = {"requests": 0, "in_flight": 0, "errors": 0, "header_seconds": 0.0}
+# identical non-streamed model calls in flight at the same time share one request
+llm_flight = SingleFlight("llm")
+
+
+class PooledTransport(httpx.AsyncBaseTransport):
+    """Connection pooling transport that keeps request statistics."""
+
+    def __init__(self, **kwargs):
+        self.transport = httpx.AsyncHTTPTransport(**kwargs)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        _stats["requests"] += 1
+        _stats["in_flight"] += 1
+        started = time.perf_counter()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except Exception:
+            _stats["errors"] += 1
+            raise
+        finally:
+            _stats["in_flight"] -= 1
+            _stats["header_seconds"] += time.perf_counter() - started
+        if response.status_code >= 400:
+            _stats["errors"] += 1
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def _http2_available() -> bool:
+    if not LLM_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        print("[LLM] HTTP/2 requested but the 'h2' package is missing, using HTTP/1.1")
+        return False
+    return True
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """The pooled HTTP client behind all LLM calls."""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            # rate limits, adaptive concurrency and retries shared by all agents
+            transport=GovernedTransport(
+                PooledTransport(
+                    http2=_http2_available(),
+                    limits=httpx.Limits(
+                        max_connections=LLM_MAX_CONNECTIONS,
+                        max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                        keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+                    ),
+                ),
+                llm_governor,
+            ),
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        )
+    return _http_client
+
+
+def get_llm_client() -> AsyncOpenAI:
+    """The OpenAI compatible client shared by all agents."""
+    global _client
+    if _client is None:
+        _client = AsyncOpenAI(
+            api_key=GOOGLE_API_KEY,
+            base_url=BASE_URL,
+            http_client=get_http_client(),
+            max_retries=0,  # retries are done by the governed transport
+        )
+    return _client
+
+
+class CoalescingModel(OpenAIChatCompletionsModel):
+    """Chat completions model whose identical concurrent calls share one request.
+
+    Calls are keyed by a hash of everything that goes into the prompt, so two
+    runs asking a stage agent the same thing at the same moment get the same
+    response. Streamed calls are not coalesced.
+
+    The shared client is looked up on every call instead of being passed in,
+    so defining an agent does not build the client and its connection pool.
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+
+    @property
+    def _client(self) -> AsyncOpenAI:
+        return get_llm_client()
+
+    async def get_response(
+        self,
+        system_instructions,
+        input,
+        model_settings,
+        tools,
+        output_schema,
+        handoffs,
+        tracing: ModelTracing,
+        previous_response_id,
+        prompt=None,
+    ):
+        key = prompt_key(
+            self.model,
+            system_instructions,
+            input,
+            model_settings.to_json_dict(),
+            [getattr(tool, "name", None) for tool in tools],
+            output_schema.json_schema() if output_schema and not output_schema.is_plain_text() else None,
+            [handoff.tool_name for handoff in handoffs],
+            previous_response_id,
+            prompt,
+        )
+        return await llm_flight.do(
+            key,
+            lambda: self.fetch_response(
+                system_instructions,
+                input,
+                model_settings,
+                tools,
+                output_schema,
+                handoffs,
+                tracing,
+                previous_response_id,
+                prompt,
+            ),
+        )
+
+    async def fetch_response(
+        self,
+        system_instructions,
+        input,
+        model_settings,
+        tools,
+        output_schema,
+        handoffs,
+        tracing: ModelTracing,
+        previous_response_id,
+        prompt=None,
+    ):
+        """get_response without coalescing, for hedged duplicates of a call."""
+        return await super().get_response(
+            system_instructions,
+            input,
+            model_settings,
+            tools,
+            output_schema,
+            handoffs,
+            tracing,
+            previous_response_id=previous_response_id,
+            prompt=prompt,
+        )
+
+
+def prompt_key(*parts) -> str:
+    """Stable hash of a model call's inputs."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def get_model(model: str = MODEL) -> OpenAIChatCompletionsModel:
+    """Chat completions model using the shared client."""
+    if model not in _models:
+        _models[model] = CoalescingModel(model=model)
+    return _models[model]
+
+
+def pool_stats() -> dict:
+    """Request counters and connection pool state of the shared client."""
+    stats = dict(_stats)
+    stats["avg_header_seconds"] = (
+        stats["header_seconds"] / stats["requests"] if stats["requests"] else 0.0
+    )
+    # httpcore does not expose pool statistics publicly
+    transport = _http_client._transport if _http_client else None
+    pooled = getattr(transport, "transport", None)
+    pool = getattr(getattr(pooled, "transport", None), "_pool", None)
+    connections = getattr(pool, "connections", [])
+    stats["connections"] = len(connections)
+    stats["idle_connections"] = sum(1 for c in connections if c.is_idle())
+    stats["http2"] = bool(getattr(pool, "_http2", False))
+    return stats
+
+
+async def close() -> None:
+    """Close the shared connection pool."""
+    global _http_client, _client
+    if _http_client is not None:
+        await _http_client.aclose()
+    _http_client = None
+    _client = None
+    _models.clear()
@@ -0,0 +1,184 @@
+import threading, time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Optional
+from agents.tracing import AgentSpanData, FunctionSpanData, GenerationSpanData
+from agents.tracing.processor_interface import TracingProcessor
+from utils.config import METRICS_LOG_SPANS
+
+# id of the /chat request being served, ties together the spans of one stream
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_lock = threading.Lock()
+# name -> (kind, help, buckets, {labels: value or [bucket counts..., sum, count]})
+_metrics: dict[str, tuple[str, str, tuple, dict]] = {}
+
+
+def _register(name: str, kind: str, help: str, buckets: tuple = ()) -> dict:
+    if name not in _metrics:
+        _metrics[name] = (kind, help, buckets, {})
+    return _metrics[name][3]
+
+
+def describe(name: str, kind: str, help: str, buckets: tuple = DEFAULT_BUCKETS) -> None:
+    """Declare a metric so it is rendered with its help text even before use."""
+    with _lock:
+        _register(name, kind, help, buckets if kind == "histogram" else ())
+
+
+def inc(name: str, amount: float = 1, **labels: Any) -> None:
+    """Increment a counter."""
+    key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+    with _lock:
+        values = _register(name, "counter", name)
+        values[key] = values.get(key, 0) + amount
+
+
+def set_gauge(name: str, value: float, **labels: Any) -> None:
+    """Set a gauge to its current value."""
+    key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+    with _lock:
+        _register(name, "gauge", name)[key] = value
+
+
+def observe(name: str, value: float, **labels: Any) -> None:
+    """Record one observation in a histogram."""
+    key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+    with _lock:
+        values = _register(name, "histogram", name, DEFAULT_BUCKETS)
+        buckets = _metrics[name][2]
+        state = values.setdefault(key, [0] * len(buckets) + [0.0, 0])
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                state[i] += 1
+        state[-2] += value
+        state[-1] += 1
+
+
+@contextmanager
+def timer(name: str, **labels: Any):
+    """Observe the duration of the with block in a histogram."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def _labels(key: tuple, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        for name, (kind, help, buckets, values) in sorted(_metrics.items()):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in values.items():
+                if kind in ("counter", "gauge"):
+                    lines.append(f"{name}{_labels(key)} {value}")
+                    continue
+                for bound, count in zip(buckets, value):
+                    le = f'le="{bound}"'
+                    lines.append(f"{name}_bucket{_labels(key, le)} {count}")
+                le = 'le="+Inf"'
+                lines.append(f"{name}_bucket{_labels(key, le)} {value[-1]}")
+                lines.append(f"{name}_sum{_labels(key)} {value[-2]}")
+                lines.append(f"{name}_count{_labels(key)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def _seconds(span) -> Optional[float]:
+    if not span.started_at or not span.ended_at:
+        return None
+    started = datetime.fromisoformat(span.started_at)
+    ended = datetime.fromisoformat(span.ended_at)
+    return (ended - started).total_seconds()
+
+
+class MetricsProcessor(TracingProcessor):
+    """Turns Agents SDK spans into latency and token metrics."""
+
+    def __init__(self):
+        self._agents: dict[str, str] = {}  # agent span id -> agent name
+        self._requests: dict[str, str] = {}  # trace id -> request id
+
+    def on_trace_start(self, trace) -> None:
+        request_id = getattr(trace, "group_id", None) or request_id_var.get()
+        if request_id:
+            self._requests[trace.trace_id] = request_id
+
+    def on_trace_end(self, trace) -> None:
+        self._requests.pop(trace.trace_id, None)
+
+    def on_span_start(self, span) -> None:
+        if isinstance(span.span_data, AgentSpanData):
+            self._agents[span.span_id] = span.span_data.name
+
+    def on_span_end(self, span) -> None:
+        data = span.span_data
+        seconds = _seconds(span)
+        if isinstance(data, AgentSpanData):
+            self._agents.pop(span.span_id, None)
+            if seconds is not None:
+                observe("agent_turn_seconds", seconds, agent=data.name)
+                if METRICS_LOG_SPANS:
+                    print(
+                        f"[metrics] request={self._requests.get(span.trace_id)} "
+                        f"agent={data.name} {seconds:.2f}s"
+                    )
+        elif isinstance(data, GenerationSpanData):
+            agent = self._agents.get(span.parent_id, "unknown")
+            if seconds is not None:
+                observe("llm_call_seconds", seconds, agent=agent, model=data.model)
+            usage = data.usage or {}
+            inc("llm_input_tokens_total", usage.get("input_tokens", 0), agent=agent)
+            inc("llm_output_tokens_total", usage.get("output_tokens", 0), agent=agent)
+        elif isinstance(data, FunctionSpanData):
+            if seconds is not None:
+                observe("tool_seconds", seconds, tool=data.name)
+
+    def shutdown(self) -> None:
+        pass
+
+    def force_flush(self) -> None:
+        pass
+
+
+describe("chat_ttft_seconds", "histogram", "Time from /chat request to the first streamed token.")
+describe("chat_stream_seconds", "histogram", "Duration of a whole /chat stream.")
+describe("agent_ttft_seconds", "histogram", "Time from an agent getting the turn to its first text token, per agent.")
+describe("agent_turn_seconds", "histogram", "Duration of an agent span, per agent.")
+describe("llm_call_seconds", "histogram", "Duration of one model call, per agent and model.")
+describe("llm_input_tokens_total", "counter", "Input tokens sent to the model, per agent.")
+describe("llm_output_tokens_total", "counter", "Output tokens produced by the model, per agent.")
+describe("tool_seconds", "histogram", "Duration of a function tool call.")
+describe("tavily_seconds", "histogram", "Duration of a Tavily API call, per operation.")
+describe("cache_lookups_total", "counter", "Cache lookups, per cache and result.")
+describe("supabase_seconds", "histogram", "Duration of a Supabase session operation.")
+describe("supabase_round_trips_total", "counter", "Supabase requests made, per session operation.")
+describe("session_seconds", "histogram", "Duration of a local SQLite session operation.")
+describe("session_replication_total", "counter", "Session writes replicated to Supabase in the background, per operation and outcome.")
+describe("job_queue_seconds", "histogram", "Time a job waited for a free worker.")
+describe("job_run_seconds", "histogram", "Time a worker spent running a job.")
+describe("jobs_submitted_total", "counter", "Jobs admitted to the queue.")
+describe("jobs_rejected_total", "counter", "Jobs turned away, per reason (user or capacity).")
+describe("singleflight_calls_total", "counter", "Calls that started a request or shared one in flight, per group.")
+describe("upstream_calls_total", "counter", "Upstream calls per provider and outcome (ok, overload, error).")
+describe("upstream_retries_total", "counter", "Retries of overloaded upstream calls, per provider.")
+describe("upstream_concurrency_limit", "gauge", "Current adaptive concurrency limit, per provider.")
+describe("model_route_calls_total", "counter", "Model calls per agent route, model and outcome.")
+describe("model_route_seconds", "histogram", "Model call latency per route and model (time to first event when streaming).")
+describe("model_route_failovers_total", "counter", "Failed calls retried on the next model of the route.")
+describe("model_route_fallbacks_total", "counter", "Times a model was taken out of its route, per reason (latency or errors).")
+describe("model_route_active", "gauge", "1 for the model a route currently sends its calls to.")
+describe("hedged_calls_total", "counter", "Backup calls for slow requests per call site: issued, won (backup finished first), over_budget.")
+describe("deadline_degradations_total", "counter", "Research stages cut down to meet the request deadline, per stage.")
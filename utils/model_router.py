@@ -0,0 +1,278 @@
+import asyncio, time
+from collections import deque
+from dataclasses import dataclass, replace
+from typing import AsyncIterator, Optional
+from agents import ModelSettings
+from agents.models.interface import Model
+from logger_colors import BLUE, RED, RESET
+from utils import metrics
+from utils.hedging import Hedger
+from utils.llm import get_model
+from utils.config import (
+    MODEL,
+    MODEL_ROUTES,
+    ROUTE_WINDOW,
+    ROUTE_MIN_CALLS,
+    ROUTE_MAX_ERROR_RATE,
+    ROUTE_MAX_P95,
+    ROUTE_COOLDOWN,
+)
+
+
+@dataclass
+class ModelRoute:
+    """Models and settings of one agent, primary model first."""
+
+    name: str
+    models: list[str]
+    max_tokens: Optional[int] = None
+    temperature: Optional[float] = None
+    timeout: Optional[float] = None  # per call; time to first event when streaming
+    max_p95: float = ROUTE_MAX_P95  # seconds, 0 = latency does not move traffic
+
+    @classmethod
+    def from_config(cls, name: str, config: dict) -> "ModelRoute":
+        models = config.get("models") or [config.get("model") or MODEL]
+        if isinstance(models, str):
+            models = [models]
+        return cls(
+            name=name,
+            models=list(models),
+            max_tokens=config.get("max_tokens"),
+            temperature=config.get("temperature"),
+            timeout=config.get("timeout"),
+            max_p95=config.get("max_p95", ROUTE_MAX_P95),
+        )
+
+
+class ModelHealth:
+    """Rolling latency and error rate of one model on one route."""
+
+    def __init__(self, window: int = ROUTE_WINDOW):
+        self.samples: deque[tuple[float, bool]] = deque(maxlen=window)  # (seconds, ok)
+        self.down_until = 0.0
+
+    def record(self, seconds: float, ok: bool) -> None:
+        self.samples.append((seconds, ok))
+
+    def p95(self) -> Optional[float]:
+        latencies = sorted(seconds for seconds, ok in self.samples if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+    def error_rate(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+    def available(self, now: float) -> bool:
+        return now >= self.down_until
+
+
+class RoutedModel(Model):
+    """Sends an agent's calls to the first healthy model of its route.
+
+    Each model's recent latency and errors are tracked per route. When its
+    p95 or error rate crosses the threshold it is skipped for ROUTE_COOLDOWN
+    seconds, then tried again with a clean window. A call that fails (or a
+    stream that fails before its first event) is retried once on each
+    remaining model of the chain. Non-streamed calls are hedged (see
+    utils.hedging) on the next model of the chain.
+    """
+
+    def __init__(self, route: ModelRoute):
+        self.route = route
+        self.health = {model: ModelHealth() for model in route.models}
+        self.settings = ModelSettings(max_tokens=route.max_tokens, temperature=route.temperature)
+        self.hedger = Hedger(f"llm:{route.name}")
+        self._publish()
+
+    def _resolve(self, model_settings: ModelSettings) -> ModelSettings:
+        """The route's settings over the agent's; max_tokens is a ceiling, so a lower one set by the agent stays."""
+        settings = self.settings.resolve(model_settings)
+        if model_settings.max_tokens and self.route.max_tokens:
+            settings = replace(settings, max_tokens=min(model_settings.max_tokens, self.route.max_tokens))
+        return settings
+
+    def _candidates(self) -> list[str]:
+        """Available models in chain order, then the unavailable ones, soonest back first."""
+        now = time.monotonic()
+        available = [m for m in self.route.models if self.health[m].available(now)]
+        down = sorted(
+            (m for m in self.route.models if m not in available),
+            key=lambda m: self.health[m].down_until,
+        )
+        return available + down
+
+    def _publish(self) -> None:
+        active = self._candidates()[0]
+        for model in self.route.models:
+            metrics.set_gauge(
+                "model_route_active", int(model == active), route=self.route.name, model=model
+            )
+
+    def _record(self, model: str, seconds: float, ok: bool) -> None:
+        health = self.health[model]
+        health.record(seconds, ok)
+        metrics.inc(
+            "model_route_calls_total", route=self.route.name, model=model, outcome="ok" if ok else "error"
+        )
+        if ok:
+            metrics.observe("model_route_seconds", seconds, route=self.route.name, model=model)
+        if len(self.route.models) < 2 or len(health.samples) < ROUTE_MIN_CALLS:
+            return
+        p95 = health.p95()
+        if health.error_rate() > ROUTE_MAX_ERROR_RATE:
+            reason = "errors"
+        elif self.route.max_p95 and p95 is not None and p95 > self.route.max_p95:
+            reason = "latency"
+        else:
+            return
+        print(
+            f"{RED} Model route {self.route.name}: {model} taken out for {ROUTE_COOLDOWN:.0f}s "
+            f"({reason}, p95 {p95 or 0:.1f}s, error rate {health.error_rate():.0%}) {RESET}"
+        )
+        health.down_until = time.monotonic() + ROUTE_COOLDOWN
+        health.samples.clear()
+        metrics.inc("model_route_fallbacks_total", route=self.route.name, model=model, reason=reason)
+        self._publish()
+
+    def _failover(self, model: str, e: Exception) -> None:
+        print(f"{BLUE} Model route {self.route.name}: {model} failed ({e!r}), trying the next model {RESET}")
+        metrics.inc("model_route_failovers_total", route=self.route.name, model=model)
+
+    async def _attempt(self, model: str, args: tuple, kwargs: dict, coalesce: bool = True):
+        """One get_response call on one model, recorded in its health."""
+        llm = get_model(model)
+        fetch = llm.get_response if coalesce else llm.fetch_response
+        started = time.monotonic()
+        try:
+            response = await asyncio.wait_for(fetch(*args, **kwargs), self.route.timeout)
+        except Exception:
+            self._record(model, time.monotonic() - started, False)
+            raise
+        self._record(model, time.monotonic() - started, True)
+        return response
+
+    async def get_response(
+        self,
+        system_instructions,
+        input,
+        model_settings,
+        tools,
+        output_schema,
+        handoffs,
+        tracing,
+        *,
+        previous_response_id,
+        prompt=None,
+    ):
+        args = (
+            system_instructions,
+            input,
+            self._resolve(model_settings),
+            tools,
+            output_schema,
+            handoffs,
+            tracing,
+        )
+        kwargs = {"previous_response_id": previous_response_id, "prompt": prompt}
+        candidates = self._candidates()
+        for i, model in enumerate(candidates):
+            last = i == len(candidates) - 1
+            # a slow call is hedged on the next model of the chain, or the same one again
+            backup = model if last else candidates[i + 1]
+            try:
+                return await self.hedger.call(
+                    lambda: self._attempt(model, args, kwargs),
+                    lambda: self._attempt(backup, args, kwargs, coalesce=False),
+                )
+            except Exception as e:
+                if last:
+                    raise
+                self._failover(model, e)
+
+    async def stream_response(
+        self,
+        system_instructions,
+        input,
+        model_settings,
+        tools,
+        output_schema,
+        handoffs,
+        tracing,
+        *,
+        previous_response_id,
+        prompt=None,
+    ) -> AsyncIterator:
+        settings = self._resolve(model_settings)
+        candidates = self._candidates()
+        for i, model in enumerate(candidates):
+            started = time.monotonic()
+            stream = get_model(model).stream_response(
+                system_instructions,
+                input,
+                settings,
+                tools,
+                output_schema,
+                handoffs,
+                tracing,
+                previous_response_id=previous_response_id,
+                prompt=prompt,
+            )
+            try:
+                first = await asyncio.wait_for(anext(stream), self.route.timeout)
+            except StopAsyncIteration:
+                self._record(model, time.monotonic() - started, True)
+                return
+            except Exception as e:
+                await stream.aclose()
+                self._record(model, time.monotonic() - started, False)
+                if i == len(candidates) - 1:
+                    raise
+                self._failover(model, e)
+                continue
+            first_event = time.monotonic() - started
+            try:
+                yield first
+                async for event in stream:
+                    yield event
+            except Exception:
+                # too late to switch models once events went out
+                self._record(model, first_event, False)
+                raise
+            self._record(model, first_event, True)
+            return
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "route": self.route.name,
+            "active": self._candidates()[0],
+            "models": [
+                {
+                    "model": model,
+                    "calls": len(health.samples),
+                    "p95": health.p95(),
+                    "error_rate": round(health.error_rate(), 3),
+                    "down_for": max(0.0, round(health.down_until - now, 1)),
+                }
+                for model, health in self.health.items()
+            ],
+        }
+
+
+_routes: dict[str, RoutedModel] = {}
+
+
+def get_routed_model(route: str) -> RoutedModel:
+    """The model of an agent route, configured by MODEL_ROUTES."""
+    if route not in _routes:
+        _routes[route] = RoutedModel(ModelRoute.from_config(route, MODEL_ROUTES.get(route, {})))
+    return _routes[route]
+
+
+def route_stats() -> list[dict]:
+    """Active model and rolling health of every route in use."""
+    return [model.stats() for model in _routes.values()]
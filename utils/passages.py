@@ -0,0 +1,123 @@
+import math, re
+from collections import Counter
+from utils.config import PASSAGE_WORDS, PASSAGE_TOP_K, PASSAGE_TOKEN_BUDGET
+from utils.text import tokenize
+
+PARAGRAPH_RE = re.compile(r"\n\s*\n")
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def split_passages(text: str, max_words: int = PASSAGE_WORDS) -> list[str]:
+    """Passages of about max_words words: short paragraphs merged, long ones cut."""
+    passages: list[str] = []
+    current: list[str] = []
+    length = 0
+    for paragraph in PARAGRAPH_RE.split(text):
+        words = paragraph.split()
+        if not words:
+            continue
+        if current and length + len(words) > max_words:
+            passages.append("\n\n".join(current))
+            current, length = [], 0
+        while len(words) > max_words:
+            passages.append(" ".join(words[:max_words]))
+            words = words[max_words:]
+        if words:
+            current.append(" ".join(words))
+            length += len(words)
+    if current:
+        passages.append("\n\n".join(current))
+    return passages
+
+
+class BM25:
+    """Okapi BM25 scores over a fixed list of tokenized passages."""
+
+    def __init__(self, passages: list[list[str]]):
+        self.term_counts = [Counter(passage) for passage in passages]
+        self.lengths = [len(passage) for passage in passages]
+        self.avg_length = sum(self.lengths) / len(passages) if passages else 1.0
+        df = Counter(term for counts in self.term_counts for term in counts)
+        n = len(passages)
+        self.idf = {term: math.log(1 + (n - f + 0.5) / (f + 0.5)) for term, f in df.items()}
+
+    def score(self, query: list[str], i: int) -> float:
+        counts = self.term_counts[i]
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[i] / (self.avg_length or 1))
+        return sum(
+            self.idf[term] * counts[term] * (BM25_K1 + 1) / (counts[term] + norm)
+            for term in set(query)
+            if term in counts
+        )
+
+
+def select_passages(
+    documents: list[dict],
+    queries: list[str],
+    top_k: int = PASSAGE_TOP_K,
+    token_budget: int = PASSAGE_TOKEN_BUDGET,
+) -> list[dict]:
+    """Cut documents down to their passages most relevant to the queries.
+
+    Passages are scored with BM25 against every query (the scores summed).
+    Each document keeps at most its top_k matching passages, in page order.
+    Under the token budget every document's best passage is taken first, then
+    the second best, and so on. Documents left without a passage are dropped.
+    When no passage matches at all, each document's leading passages are
+    taken instead, under the same limits.
+    """
+    if top_k <= 0 or not documents:
+        return documents
+
+    candidates = [  # (document index, passage)
+        (d, passage)
+        for d, doc in enumerate(documents)
+        for passage in split_passages(doc.get("raw_content") or "")
+    ]
+    index = BM25([tokenize(passage) for _, passage in candidates])
+    query_terms = [tokenize(query) for query in queries]
+    scored = sorted(
+        ((sum(index.score(terms, i) for terms in query_terms), i) for i in range(len(candidates))),
+        reverse=True,
+    )
+
+    picks: dict[int, list[tuple[float, int]]] = {}
+    for score, i in scored:
+        if score <= 0:
+            break
+        best = picks.setdefault(candidates[i][0], [])
+        if len(best) < top_k:
+            best.append((score, i))
+    if not picks:
+        print("[Passages] no passage matches the queries, keeping the leading passages")
+        for i, (d, _) in enumerate(candidates):
+            best = picks.setdefault(d, [])
+            if len(best) < top_k:
+                best.append((0.0, i))
+
+    chosen: set[int] = set()
+    tokens = 0
+    for _, _, i in sorted(
+        (rank, -score, i) for best in picks.values() for rank, (score, i) in enumerate(best)
+    ):
+        cost = len(candidates[i][1]) // 4 + 1
+        if tokens + cost <= token_budget:
+            chosen.add(i)
+            tokens += cost
+
+    by_document: dict[int, list[str]] = {}
+    for i in sorted(chosen):  # candidates are in page order
+        by_document.setdefault(candidates[i][0], []).append(candidates[i][1])
+    kept = [
+        {**doc, "raw_content": "\n\n".join(by_document[d])}
+        for d, doc in enumerate(documents)
+        if d in by_document
+    ]
+
+    total = sum(len(passage) // 4 + 1 for _, passage in candidates)
+    print(
+        f"[Passages] kept {len(chosen)} of {len(candidates)} passages from "
+        f"{len(kept)} of {len(documents)} documents, ~{tokens} of ~{total} tokens"
+    )
+    return kept
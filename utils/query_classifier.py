@@ -0,0 +1,58 @@
+import re
+from typing import Optional
+
+# words that, on their own, mark a query as being about learning a skill
+LEARNING_TERMS = {
+    "learn", "learning", "study", "studying", "course", "courses", "tutorial",
+    "tutorials", "roadmap", "roadmaps", "curriculum", "syllabus", "bootcamp",
+    "certification", "lessons", "udemy", "coursera",
+}
+
+# phrases that are off topic for a learning research assistant, or attempts
+# to steer it elsewhere, whatever else the message says
+OFF_TOPIC_PATTERNS = [
+    r"\bweather\b",
+    r"\btell me a joke\b",
+    r"\b(stock|share) price\b",
+    r"\bwho won\b",
+    r"\bwrite (me )?(a )?(poem|song|story)\b",
+    r"\bbook (me )?(a )?(flight|hotel|table|ticket)s?\b",
+    r"\b(ignore|disregard|forget) (all |any )?(the )?(previous|prior|above|earlier) instructions\b",
+    r"\bsystem prompt\b",
+]
+
+# a new query is taken as on topic without the LLM up to this many words
+LEARNING_MAX_WORDS = 20
+
+# a reply to clarifying questions is a follow-up answer up to this many words
+FOLLOW_UP_MAX_WORDS = 25
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase and collapse whitespace, used for cache keys and matching."""
+    return re.sub(r"\s+", " ", text.strip().lower())
+
+
+def classify_query(text: str, in_conversation: bool) -> Optional[bool]:
+    """Cheap local relevance check in front of the LLM guardrail.
+
+    Args:
+        text: The latest user message.
+        in_conversation: Whether the user is answering the clarifying
+            questions asked right before, in an accepted (on-topic) exchange.
+
+    Returns:
+        True or False when the case is obvious, None when it is ambiguous and
+        the LLM has to decide.
+    """
+    text = normalize_text(text)
+    words = re.findall(r"[a-z0-9+#]+", text)
+    if not words:
+        return None
+    if any(re.search(pattern, text) for pattern in OFF_TOPIC_PATTERNS):
+        return False
+    if len(words) <= LEARNING_MAX_WORDS and LEARNING_TERMS.intersection(words):
+        return True
+    if in_conversation and len(words) <= FOLLOW_UP_MAX_WORDS:
+        return True
+    return None
@@ -0,0 +1,398 @@
+import asyncio, email.utils, random, sys, time
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+import httpx
+from logger_colors import RED, RESET
+from utils import metrics
+from utils.shared_store import SharedStore, shared_store
+from utils.config import (
+    EXTRACT_CONCURRENCY,
+    LLM_TIMEOUT,
+    LLM_LATENCY_TARGET,
+    LLM_MAX_CONCURRENCY,
+    LLM_RATE_LIMIT,
+    RETRY_BASE_DELAY,
+    RETRY_MAX_ATTEMPTS,
+    RETRY_MAX_DELAY,
+    RATE_LIMIT_SHARED,
+    TAVILY_EXTRACT_RATE_LIMIT,
+    TAVILY_LATENCY_TARGET,
+    TAVILY_SEARCH_MAX_CONCURRENCY,
+    TAVILY_SEARCH_RATE_LIMIT,
+)
+
+# statuses that mean "slow down", worth retrying
+OVERLOAD_STATUSES = {429, 500, 502, 503, 504}
+
+
+class Overloaded(Exception):
+    """An upstream answered with an overload status; carries its Retry-After."""
+
+    def __init__(self, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(f"upstream overloaded ({status_code})")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def overload_of(e: Exception) -> Optional[Overloaded]:
+    """The overload behind an exception, None if it is not worth retrying."""
+    if isinstance(e, Overloaded):
+        return e
+    # tavily is imported lazily; if it has not been, no Tavily call was made
+    tavily_errors = sys.modules.get("tavily.errors")
+    if tavily_errors and isinstance(e, tavily_errors.UsageLimitExceededError):  # Tavily's 429
+        return Overloaded(429)
+    if isinstance(e, httpx.HTTPStatusError) and e.response.status_code in OVERLOAD_STATUSES:
+        return Overloaded(
+            e.response.status_code, parse_retry_after(e.response.headers.get("retry-after"))
+        )
+    if isinstance(e, httpx.TimeoutException) or (
+        tavily_errors and isinstance(e, tavily_errors.TimeoutError)
+    ):
+        return Overloaded(408)
+    return None
+
+
+class TokenBucket:
+    """Average rate of ``rate`` requests per second, bursts up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AdaptiveConcurrency:
+    """Concurrency limit adjusted AIMD style.
+
+    Every successful call under the latency target raises the limit by
+    1/limit (about +1 per round of calls); an overload halves it and a slow
+    call trims it by 10%, at most once per ``cooldown`` seconds so a burst
+    of failures from the same round counts once.
+    """
+
+    def __init__(
+        self,
+        maximum: int,
+        minimum: int = 1,
+        latency_target: float = 0,
+        cooldown: float = 1.0,
+    ):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+        self.limit = float(maximum)
+        self.in_flight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+
+    async def acquire(self) -> None:
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed over just before the cancellation
+                self.in_flight -= 1
+                self._wake()
+            raise
+
+    def release(self, outcome: str, latency: float) -> None:
+        """Free a slot; outcome is "ok", "overload" or "error" (not counted)."""
+        self.in_flight -= 1
+        if outcome == "overload":
+            self._decrease(0.5)
+        elif outcome == "ok":
+            if self.latency_target and latency > self.latency_target:
+                self._decrease(0.9)
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        self._wake()
+
+    def _decrease(self, factor: float) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit * factor)
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+
+class _Slot:
+    """A granted call: when it started and, in shared mode, its lease."""
+
+    __slots__ = ("started", "lease")
+
+    def __init__(self, started: float, lease: Optional[str] = None):
+        self.started = started
+        self.lease = lease
+
+
+class Governor:
+    """Rate, concurrency and retry policy for one upstream provider.
+
+    Shared by every agent and tool calling that provider: a token bucket
+    paces requests to the quota, an adaptive concurrency limit backs off on
+    429s and slow answers, and a Retry-After pauses the whole provider.
+    With a SharedStore the bucket, the limit, the in-flight calls and the
+    pauses are shared by all worker processes instead of kept in memory.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        max_concurrency: int,
+        latency_target: float = 0,
+        max_attempts: int = RETRY_MAX_ATTEMPTS,
+        store: Optional[SharedStore] = None,
+        lease_ttl: float = 600,
+    ):
+        self.name = name
+        self.bucket = TokenBucket(rate)
+        self.concurrency = AdaptiveConcurrency(max_concurrency, latency_target=latency_target)
+        self.max_attempts = max_attempts
+        self.store = store
+        self.lease_ttl = lease_ttl  # a dead process's slots come back after this
+        self.paused_until = 0.0
+        self.retries = 0
+        self.overloads = 0
+
+    async def acquire(self) -> _Slot:
+        """Wait for a slot, to be handed back to release()."""
+        if self.store is not None:
+            return await self._acquire_shared()
+        pause = self.paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        await self.bucket.acquire()
+        await self.concurrency.acquire()
+        return _Slot(time.monotonic())
+
+    async def _acquire_shared(self) -> _Slot:
+        while True:
+            wait = await asyncio.to_thread(
+                self.store.take_token,
+                self.name,
+                self.bucket.rate,
+                self.bucket.capacity,
+                self.concurrency.maximum,
+            )
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        while True:
+            lease = await asyncio.to_thread(
+                self.store.acquire_lease, self.name, self.concurrency.maximum, self.lease_ttl
+            )
+            if lease:
+                return _Slot(time.monotonic(), lease)
+            # other processes hold every slot; they cannot wake us, so poll
+            await asyncio.sleep(random.uniform(0.02, 0.1))
+
+    async def release(self, slot: _Slot, outcome: str, latency: Optional[float] = None) -> None:
+        if latency is None:
+            latency = time.monotonic() - slot.started
+        if slot.lease is None:
+            self.concurrency.release(outcome, latency)
+        else:
+            if outcome == "overload":
+                factor = 0.5
+            elif outcome == "ok":
+                slow = self.concurrency.latency_target and latency > self.concurrency.latency_target
+                factor = 0.9 if slow else None
+            else:
+                factor = 1.0
+            self.concurrency.limit = await asyncio.to_thread(
+                self.store.release_lease,
+                self.name,
+                slot.lease,
+                factor,
+                self.concurrency.maximum,
+                self.concurrency.minimum,
+                self.concurrency.cooldown,
+            )
+        self.overloads += outcome == "overload"
+        metrics.inc("upstream_calls_total", provider=self.name, outcome=outcome)
+        metrics.set_gauge("upstream_concurrency_limit", self.concurrency.limit, provider=self.name)
+
+    async def backoff(self, attempt: int, overload: Overloaded) -> float:
+        """Delay before retry number ``attempt``; a Retry-After pauses every caller."""
+        self.retries += 1
+        metrics.inc("upstream_retries_total", provider=self.name)
+        if overload.retry_after is not None:
+            self.paused_until = max(self.paused_until, time.monotonic() + overload.retry_after)
+            if self.store is not None:
+                await asyncio.to_thread(
+                    self.store.pause, self.name, time.time() + overload.retry_after
+                )
+            return overload.retry_after + random.uniform(0, RETRY_BASE_DELAY)
+        # full jitter keeps retrying callers from synchronizing
+        return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+
+    async def call(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn() under the policy, retrying overloads; other errors are raised."""
+        for attempt in range(1, self.max_attempts + 1):
+            slot = await self.acquire()
+            outcome = "error"
+            try:
+                result = await fn()
+                outcome = "ok"
+                return result
+            except Exception as e:
+                overload = overload_of(e)
+                if overload is None:
+                    raise
+                outcome = "overload"
+                if attempt == self.max_attempts:
+                    print(f"{RED}[{self.name}] giving up after {attempt} attempts: {e}{RESET}")
+                    raise
+            finally:
+                await self.release(slot, outcome)
+            delay = await self.backoff(attempt, overload)
+            print(f"{RED}[{self.name}] overloaded ({overload.status_code}), retrying in {delay:.1f}s{RESET}")
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "concurrency_limit": round(self.concurrency.limit, 2),
+            "in_flight": self.concurrency.in_flight,
+            "shared": self.store is not None,
+            "retries": self.retries,
+            "overloads": self.overloads,
+        }
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Response body that frees its governor slot once it is closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close: Callable[[], Awaitable[None]]):
+        self.stream = stream
+        self.on_close = on_close
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self.stream.aclose()
+        finally:
+            if self.on_close:
+                on_close, self.on_close = self.on_close, None
+                await on_close()
+
+
+class GovernedTransport(httpx.AsyncBaseTransport):
+    """httpx transport that sends every request through a Governor.
+
+    The slot is held until the response body is closed, so streamed
+    completions count against the concurrency limit for their whole length.
+    An overload status that is still there after the last attempt is handed
+    back to the client as is.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, governor: Governor):
+        self.transport = transport
+        self.governor = governor
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        for attempt in range(1, self.governor.max_attempts + 1):
+            slot = await self.governor.acquire()
+            try:
+                response = await self.transport.handle_async_request(request)
+            except BaseException as e:
+                overload = overload_of(e) if isinstance(e, Exception) else None
+                await self.governor.release(slot, "overload" if overload else "error")
+                if overload is None or attempt == self.governor.max_attempts:
+                    raise
+            else:
+                if response.status_code not in OVERLOAD_STATUSES:
+                    latency = time.monotonic() - slot.started  # judged on time to headers
+                    response.stream = _ReleasingStream(
+                        response.stream,
+                        lambda: self.governor.release(slot, "ok", latency),
+                    )
+                    return response
+                await self.governor.release(slot, "overload")
+                if attempt == self.governor.max_attempts:
+                    return response
+                overload = Overloaded(
+                    response.status_code, parse_retry_after(response.headers.get("retry-after"))
+                )
+                await response.aclose()
+            delay = await self.governor.backoff(attempt, overload)
+            print(f"{RED}[{self.governor.name}] overloaded ({overload.status_code}), retrying in {delay:.1f}s{RESET}")
+            await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+# worker processes of a multi-process server share one state in SQLite
+_store = shared_store if RATE_LIMIT_SHARED else None
+llm_governor = Governor(
+    "llm", LLM_RATE_LIMIT, LLM_MAX_CONCURRENCY, LLM_LATENCY_TARGET, store=_store, lease_ttl=LLM_TIMEOUT
+)
+search_governor = Governor(
+    "tavily_search",
+    TAVILY_SEARCH_RATE_LIMIT,
+    TAVILY_SEARCH_MAX_CONCURRENCY,
+    TAVILY_LATENCY_TARGET,
+    store=_store,
+    lease_ttl=120,
+)
+extract_governor = Governor(
+    "tavily_extract",
+    TAVILY_EXTRACT_RATE_LIMIT,
+    EXTRACT_CONCURRENCY,
+    TAVILY_LATENCY_TARGET,
+    store=_store,
+    lease_ttl=120,
+)
+
+
+def governor_stats() -> list[dict]:
+    return [g.stats() for g in (llm_governor, search_governor, extract_governor)]
@@ -0,0 +1,184 @@
+import asyncio, math, os, sqlite3, threading, time
+from collections import Counter
+from typing import Optional
+from utils import metrics
+from utils.text import tokenize
+from utils.config import (
+    CACHE_DB_PATH,
+    REPORT_CACHE_THRESHOLD,
+    REPORT_CACHE_TTL,
+    REPORT_CACHE_MAX_ENTRIES,
+)
+
+
+class ReportCache:
+    """Finished research reports, looked up by TF-IDF cosine similarity.
+
+    Every report is stored with the text it was produced for (the query plus
+    the gathered requirements). A lookup returns the most similar fresh report
+    if its similarity reaches the threshold.
+    """
+
+    def __init__(
+        self,
+        threshold: float = REPORT_CACHE_THRESHOLD,
+        ttl: int = REPORT_CACHE_TTL,
+        max_entries: int = REPORT_CACHE_MAX_ENTRIES,
+        db_path: str = CACHE_DB_PATH,
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()  # guards the db and the in-memory index
+        # id -> (term counts, created_at), loaded from disk on first use
+        self._entries: Optional[dict[int, tuple[Counter, float]]] = None
+        self._df: Counter = Counter()
+        self._last_id = 0  # newest report already in the index
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.hit_age_total = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS research_reports (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    request TEXT NOT NULL,
+                    report TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )"""
+            )
+        return self._db
+
+    def _load(self) -> None:
+        """Index the reports added since the last call, by any worker process."""
+        if self._entries is None:
+            self._entries = {}
+        rows = self._connect().execute(
+            "SELECT id, request, created_at FROM research_reports WHERE id > ?",
+            (self._last_id,),
+        ).fetchall()
+        for entry_id, request, created_at in rows:
+            self._add_entry(entry_id, request, created_at)
+            self._last_id = max(self._last_id, entry_id)
+
+    def _add_entry(self, entry_id: int, request: str, created_at: float) -> None:
+        terms = Counter(tokenize(request))
+        self._entries[entry_id] = (terms, created_at)
+        self._df.update(terms.keys())
+
+    def _remove_entry(self, entry_id: int) -> None:
+        terms, _ = self._entries.pop(entry_id)
+        self._df.subtract(terms.keys())
+
+    def _vector(self, terms: Counter) -> dict[str, float]:
+        n = len(self._entries) + 1
+        vector = {
+            term: (1 + math.log(count)) * math.log((n + 1) / (self._df[term] + 1))
+            for term, count in terms.items()
+        }
+        norm = math.sqrt(sum(w * w for w in vector.values())) or 1.0
+        return {term: w / norm for term, w in vector.items()}
+
+    def _lookup(self, request: str) -> Optional[tuple[str, float, float]]:
+        self._load()
+        now = time.time()
+        query = self._vector(Counter(tokenize(request)))
+        best_id, best_score, stale_match = None, 0.0, False
+        for entry_id, (terms, created_at) in self._entries.items():
+            vector = self._vector(terms)
+            score = sum(w * vector.get(term, 0.0) for term, w in query.items())
+            if now - created_at > self.ttl:
+                stale_match = stale_match or score >= self.threshold
+            elif score > best_score:
+                best_id, best_score = entry_id, score
+        if best_id is None or best_score < self.threshold:
+            self.misses += 1
+            self.stale += stale_match
+            result = "stale" if stale_match else "miss"
+            metrics.inc("cache_lookups_total", cache="research_reports", result=result)
+            return None
+
+        age = now - self._entries[best_id][1]
+        row = self._connect().execute(
+            "SELECT report FROM research_reports WHERE id = ?", (best_id,)
+        ).fetchone()
+        if row is None:
+            # evicted by another worker process
+            self._remove_entry(best_id)
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.hit_age_total += age
+        metrics.inc("cache_lookups_total", cache="research_reports", result="hit")
+        return row[0], best_score, age
+
+    def _store(self, request: str, report: str) -> None:
+        self._load()
+        now = time.time()
+        db = self._connect()
+        cursor = db.execute(
+            "INSERT INTO research_reports (request, report, created_at) VALUES (?, ?, ?)",
+            (request, report, now),
+        )
+        expired = [
+            entry_id
+            for entry_id, (_, created_at) in self._entries.items()
+            if now - created_at > self.ttl
+        ]
+        overflow = len(self._entries) + 1 - len(expired) - self.max_entries
+        if overflow > 0:
+            by_age = sorted(
+                (i for i in self._entries if i not in expired),
+                key=lambda i: self._entries[i][1],
+            )
+            expired += by_age[:overflow]
+        db.executemany(
+            "DELETE FROM research_reports WHERE id = ?", [(i,) for i in expired]
+        )
+        db.commit()
+        for entry_id in expired:
+            self._remove_entry(entry_id)
+        self._add_entry(cursor.lastrowid, request, now)
+        self._last_id = max(self._last_id, cursor.lastrowid)
+
+    def _locked(self, fn, *args):
+        with self._lock:
+            return fn(*args)
+
+    async def lookup(self, request: str) -> Optional[tuple[str, float, float]]:
+        """Return (report, similarity, age in seconds) of the best fresh match."""
+        try:
+            return await asyncio.to_thread(self._locked, self._lookup, request)
+        except sqlite3.Error as e:
+            print(f"[Report Cache Error] Failed to look up report: {e}")
+            return None
+
+    async def store(self, request: str, report: str) -> None:
+        """Store a finished report for the given request text."""
+        try:
+            await asyncio.to_thread(self._locked, self._store, request, report)
+        except sqlite3.Error as e:
+            print(f"[Report Cache Error] Failed to store report: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "avg_hit_age_seconds": self.hit_age_total / self.hits if self.hits else 0.0,
+            "entries": len(self._entries or {}),
+        }
+
+
+report_cache = ReportCache()
@@ -0,0 +1,385 @@
+import asyncio, json, os, sqlite3, threading, time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, List, Optional
+from agents.memory import Session
+from agents import TResponseInputItem
+from logger_colors import RED, RESET
+from supabase_session import SupabaseSession
+from utils import metrics
+from utils.history import compact, summary_item
+from utils.config import (
+    HISTORY_MAX_ITEMS,
+    SESSION_BACKEND,
+    SESSION_DB_PATH,
+    SESSION_HOT_ENTRIES,
+    SESSION_HOT_TTL,
+)
+
+# one connection per database file, shared by every session of the process
+_connections: dict[str, tuple[sqlite3.Connection, threading.Lock]] = {}
+_connections_lock = threading.Lock()
+# the database lock serializes local operations anyway; a thread of their own
+# keeps them from queueing behind Supabase calls in the default executor
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-session")
+
+
+def _connect(db_path: str) -> tuple[sqlite3.Connection, threading.Lock]:
+    with _connections_lock:
+        if db_path not in _connections:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(db_path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                """CREATE TABLE IF NOT EXISTS session_meta (
+                    session_id TEXT PRIMARY KEY,
+                    summary TEXT NOT NULL DEFAULT '',
+                    window_start_id INTEGER,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            db.execute(
+                """CREATE TABLE IF NOT EXISTS session_messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    message_data TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )"""
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS session_messages_session ON session_messages (session_id, id)"
+            )
+            db.commit()
+            _connections[db_path] = (db, threading.Lock())
+        return _connections[db_path]
+
+
+class SQLiteSession(Session):
+    """Session storage in a local SQLite database (WAL mode).
+
+    Same behaviour as SupabaseSession: optional write-behind buffering until
+    ``flush()``, and ``get_items()`` returns the rolling summary followed by
+    the recent window. Every operation is one local transaction.
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        write_behind: bool = False,
+        db_path: str = SESSION_DB_PATH,
+    ):
+        self.session_id = session_id
+        self.write_behind = write_behind
+        self.db_path = db_path
+        self._pending: List[TResponseInputItem] = []  # buffered, not yet written
+        self._window: Optional[list[tuple[int, TResponseInputItem]]] = None
+        self._summary = ""
+
+    async def _run(self, op: str, fn: Callable, *args):
+        """Run fn(db, *args) in a thread, holding the database lock."""
+
+        def locked():
+            db, lock = _connect(self.db_path)
+            with lock:
+                try:
+                    result = fn(db, *args)
+                    db.commit()
+                    return result
+                except BaseException:
+                    db.rollback()
+                    raise
+
+        with metrics.timer("session_seconds", op=op):
+            return await asyncio.get_running_loop().run_in_executor(_executor, locked)
+
+    def _sync_load(self, db: sqlite3.Connection):
+        db.execute(
+            "INSERT OR IGNORE INTO session_meta (session_id, updated_at) VALUES (?, ?)",
+            (self.session_id, time.time()),
+        )
+        summary, start = db.execute(
+            "SELECT summary, window_start_id FROM session_meta WHERE session_id = ?",
+            (self.session_id,),
+        ).fetchone()
+        rows = db.execute(
+            """SELECT id, message_data FROM session_messages
+               WHERE session_id = ? AND id >= ? ORDER BY id DESC LIMIT ?""",
+            (self.session_id, start or 0, HISTORY_MAX_ITEMS),
+        ).fetchall()
+        window = [(row_id, json.loads(data)) for row_id, data in reversed(rows)]
+        return summary, window
+
+    def _sync_write(self, db: sqlite3.Connection, items: List[TResponseInputItem]) -> None:
+        now = time.time()
+        window = list(self._window)
+        for item in items:
+            cursor = db.execute(
+                "INSERT INTO session_messages (session_id, message_data, created_at) VALUES (?, ?, ?)",
+                (self.session_id, json.dumps(item), now),
+            )
+            window.append((cursor.lastrowid, item))
+        window, summary, _ = compact(window, self._summary)
+        db.execute(
+            "UPDATE session_meta SET summary = ?, window_start_id = ?, updated_at = ? WHERE session_id = ?",
+            (summary, window[0][0] if window else None, now, self.session_id),
+        )
+        # kept in memory only once every statement succeeded
+        self._window, self._summary = window, summary
+
+    async def _load_window(self) -> None:
+        """Fetch the stored summary and the items of the recent window."""
+        if self._window is not None:
+            return
+        summary, window = await self._run("load_window", self._sync_load)
+        self._window, self._summary, _ = compact(window, summary)
+
+    async def get_items(self, limit: Optional[int] = None) -> List[TResponseInputItem]:
+        """Retrieve the conversation history for this session.
+
+        Without a limit this is the summary of older turns (if any) followed by
+        the recent window. With a limit it is the latest ``limit`` items.
+        """
+        if not limit:
+            await self._load_window()
+            items = [item for _, item in self._window] + self._pending
+            if self._summary:
+                items.insert(0, summary_item(self._summary))
+            return items
+
+        pending = self._pending[-limit:]
+        if len(pending) >= limit:
+            return pending
+
+        def sync_get(db: sqlite3.Connection):
+            rows = db.execute(
+                "SELECT message_data FROM session_messages WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+                (self.session_id, limit - len(pending)),
+            ).fetchall()
+            return [json.loads(data) for (data,) in reversed(rows)]
+
+        return await self._run("get_items", sync_get) + pending
+
+    async def add_items(self, items: List[TResponseInputItem]) -> None:
+        """Add new items to the conversation history."""
+        if not items:
+            return
+        if self.write_behind:
+            self._pending.extend(items)
+            return
+        await self._write(items)
+
+    async def flush(self) -> None:
+        """Write all buffered items in one transaction."""
+        if not self._pending:
+            return
+        items, self._pending = self._pending, []
+        await self._write(items)
+
+    async def _write(self, items: List[TResponseInputItem]) -> None:
+        await self._load_window()
+        await self._run("add_items", self._sync_write, items)
+
+    async def pop_item(self) -> Optional[TResponseInputItem]:
+        """Remove and return the most recent item from the session (one delete)."""
+        if self._pending:
+            return self._pending.pop()
+
+        def sync_pop(db: sqlite3.Connection):
+            row = db.execute(
+                """DELETE FROM session_messages WHERE id = (
+                       SELECT MAX(id) FROM session_messages WHERE session_id = ?
+                   ) RETURNING id, message_data""",
+                (self.session_id,),
+            ).fetchone()
+            return (row[0], json.loads(row[1])) if row else None
+
+        popped = await self._run("pop_item", sync_pop)
+        if popped is None:
+            return None
+        if self._window and self._window[-1][0] == popped[0]:
+            self._window.pop()
+        return popped[1]
+
+    async def clear_session(self) -> None:
+        """Clear all items for this session."""
+        self._pending.clear()
+        self._window = None
+        self._summary = ""
+
+        def sync_clear(db: sqlite3.Connection):
+            db.execute("DELETE FROM session_messages WHERE session_id = ?", (self.session_id,))
+            db.execute("DELETE FROM session_meta WHERE session_id = ?", (self.session_id,))
+
+        await self._run("clear_session", sync_clear)
+
+
+# background writes to Supabase still running, one chain per session
+_replication: dict[str, asyncio.Task] = {}
+
+
+def _replicate(session_id: str, op: str, write: Callable[[], Awaitable[None]]) -> None:
+    """Run write after the earlier replicated writes of the same session."""
+    previous = _replication.get(session_id)
+
+    async def run():
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await write()
+            metrics.inc("session_replication_total", op=op, outcome="ok")
+        except Exception as e:
+            print(f"{RED}[Session] Failed to replicate {op} of {session_id} to Supabase: {e}{RESET}")
+            metrics.inc("session_replication_total", op=op, outcome="error")
+        finally:
+            if _replication.get(session_id) is task:
+                del _replication[session_id]
+
+    task = asyncio.create_task(run())
+    _replication[session_id] = task
+
+
+async def drain_replication(timeout: float) -> None:
+    """Wait up to timeout seconds for the pending writes to Supabase."""
+    if _replication:
+        await asyncio.wait(list(_replication.values()), timeout=timeout)
+
+
+class TieredSession(SQLiteSession):
+    """Local SQLite session written through to Supabase in the background.
+
+    Reads and writes go to the local database; each write is then repeated
+    on Supabase without the turn waiting for it, in order per session. A
+    session with nothing stored locally (new machine, wiped disk) is first
+    seeded with its summary and window from Supabase; when Supabase cannot
+    be reached the turn goes on with the empty local session, and the seed
+    is tried again on the next load while it is still empty.
+    """
+
+    def __init__(self, session_id: str, write_behind: bool = False, db_path: str = SESSION_DB_PATH):
+        super().__init__(session_id, write_behind=write_behind, db_path=db_path)
+        self.remote = SupabaseSession(session_id)
+
+    async def _load_window(self) -> None:
+        if self._window is not None:
+            return
+        summary, window = await self._run("load_window", self._sync_load)
+        if not (window or summary):
+            try:
+                if await self._seed():
+                    return
+            except Exception as e:
+                print(f"{RED}[Session] Failed to seed {self.session_id} from Supabase: {e}{RESET}")
+        # marked loaded only now, so an empty session is seeded on its next load
+        self._window, self._summary, _ = compact(window, summary)
+
+    async def _seed(self) -> bool:
+        """Copy the Supabase summary and window into the empty local session."""
+        previous = _replication.get(self.session_id)
+        if previous is not None:  # e.g. a clear still on its way
+            await asyncio.wait([previous])
+        self.remote._window = None
+        await self.remote._load_window()
+        if not (self.remote._window or self.remote._summary):
+            return False
+
+        def sync_seed(db: sqlite3.Connection):
+            db.execute(
+                "UPDATE session_meta SET summary = ? WHERE session_id = ?",
+                (self.remote._summary, self.session_id),
+            )
+            self._window, self._summary = [], self.remote._summary
+            try:
+                self._sync_write(db, [item for _, item in self.remote._window])
+            except BaseException:
+                self._window = None
+                raise
+
+        await self._run("seed", sync_seed)
+        return True
+
+    async def _write(self, items: List[TResponseInputItem]) -> None:
+        await super()._write(items)
+        _replicate(self.session_id, "add_items", lambda: self.remote.add_items(items))
+
+    async def pop_item(self) -> Optional[TResponseInputItem]:
+        pending = bool(self._pending)
+        item = await super().pop_item()
+        if item is not None and not pending:
+            _replicate(self.session_id, "pop_item", self.remote.pop_item)
+        return item
+
+    async def clear_session(self) -> None:
+        await super().clear_session()
+        _replicate(self.session_id, "clear_session", self.remote.clear_session)
+
+
+class HotSessions:
+    """The session objects of recently active users, least recently used evicted.
+
+    A session kept here has its summary and window already loaded, so the
+    next turn reads its history without a round trip and only pays for the
+    write. Entries idle for more than ttl seconds are reloaded from storage.
+    """
+
+    def __init__(self, max_entries: int = SESSION_HOT_ENTRIES, ttl: float = SESSION_HOT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[Session, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, session_id: str, build: Callable[[], Session]) -> Session:
+        if self.max_entries <= 0:
+            return build()
+        now = time.monotonic()
+        entry = self._entries.pop(session_id, None)
+        hit = entry is not None and now - entry[1] <= self.ttl
+        if hit:
+            session = entry[0]
+            self.hits += 1
+        else:
+            session = build()
+            self.misses += 1
+        metrics.inc("cache_lookups_total", cache="hot_sessions", result="hit" if hit else "miss")
+        self._entries[session_id] = (session, now)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return session
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "replicating": len(_replication),
+        }
+
+
+hot_sessions = HotSessions()
+
+
+def create_session(
+    session_id: str,
+    write_behind: bool = False,
+    backend: str = SESSION_BACKEND,
+    hot: Optional[HotSessions] = hot_sessions,
+) -> Session:
+    """The session of session_id on the configured backend, from the hot tier if there."""
+
+    def build() -> Session:
+        if backend == "sqlite":
+            return SQLiteSession(session_id, write_behind=write_behind)
+        if backend == "tiered":
+            return TieredSession(session_id, write_behind=write_behind)
+        if backend == "supabase":
+            return SupabaseSession(session_id=session_id, write_behind=write_behind)
+        raise ValueError(f"Unknown SESSION_BACKEND: {backend!r}")
+
+    if hot is None:
+        return build()
+    return hot.get(session_id, build)
@@ -0,0 +1,158 @@
+import os, sqlite3, threading, time, uuid
+from typing import Optional
+from utils.config import CACHE_DB_PATH
+
+
+class SharedStore:
+    """Rate limiter state shared by every worker process through SQLite.
+
+    Lives in the same WAL mode file as the caches. Every operation is one
+    short write transaction, so worker processes see each other's token
+    bucket, in-flight calls (as leases that expire if a process dies),
+    adaptive concurrency limit and Retry-After pauses.
+    """
+
+    def __init__(self, db_path: str = CACHE_DB_PATH):
+        self.db_path = db_path
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(
+                self.db_path, check_same_thread=False, timeout=5, isolation_level=None
+            )
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS rate_limit_state (
+                    name TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    paused_until REAL NOT NULL DEFAULT 0,
+                    concurrency_limit REAL NOT NULL,
+                    last_decrease REAL NOT NULL DEFAULT 0
+                )"""
+            )
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS rate_limit_leases (
+                    name TEXT NOT NULL,
+                    lease_id TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (name, lease_id)
+                )"""
+            )
+        return self._db
+
+    def _transaction(self, fn):
+        with self._lock:
+            db = self._connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(db)
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+            return result
+
+    def _state(self, db: sqlite3.Connection, name: str, capacity: float, limit: float) -> tuple:
+        db.execute(
+            "INSERT OR IGNORE INTO rate_limit_state (name, tokens, updated_at, concurrency_limit) VALUES (?, ?, ?, ?)",
+            (name, capacity, time.time(), limit),
+        )
+        return db.execute(
+            "SELECT tokens, updated_at, paused_until, concurrency_limit, last_decrease FROM rate_limit_state WHERE name = ?",
+            (name,),
+        ).fetchone()
+
+    def take_token(self, name: str, rate: float, capacity: float, limit: float) -> float:
+        """Take one token from the bucket; returns 0, or the seconds to wait and retry."""
+
+        def take(db):
+            tokens, updated_at, paused_until, _, _ = self._state(db, name, capacity, limit)
+            now = time.time()
+            if paused_until > now:
+                return paused_until - now
+            if rate <= 0:
+                return 0.0
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            db.execute(
+                "UPDATE rate_limit_state SET tokens = ?, updated_at = ? WHERE name = ?",
+                (tokens, now, name),
+            )
+            return wait
+
+        return self._transaction(take)
+
+    def acquire_lease(self, name: str, limit: float, ttl: float) -> Optional[str]:
+        """A lease on one of the limit's concurrency slots, None if all are taken."""
+
+        def acquire(db):
+            current = self._state(db, name, 1, limit)[3]
+            now = time.time()
+            db.execute(
+                "DELETE FROM rate_limit_leases WHERE name = ? AND expires_at <= ?", (name, now)
+            )
+            in_flight = db.execute(
+                "SELECT COUNT(*) FROM rate_limit_leases WHERE name = ?", (name,)
+            ).fetchone()[0]
+            if in_flight >= int(current):
+                return None
+            lease_id = uuid.uuid4().hex
+            db.execute(
+                "INSERT INTO rate_limit_leases VALUES (?, ?, ?)", (name, lease_id, now + ttl)
+            )
+            return lease_id
+
+        return self._transaction(acquire)
+
+    def release_lease(
+        self,
+        name: str,
+        lease_id: str,
+        factor: Optional[float],
+        maximum: float,
+        minimum: float,
+        cooldown: float,
+    ) -> float:
+        """Drop a lease and adjust the shared limit; factor None means additive increase."""
+
+        def release(db):
+            db.execute(
+                "DELETE FROM rate_limit_leases WHERE name = ? AND lease_id = ?", (name, lease_id)
+            )
+            _, _, _, limit, last_decrease = self._state(db, name, 1, maximum)
+            now = time.time()
+            if factor is None:
+                limit = min(maximum, limit + 1 / limit)
+            elif factor < 1 and now - last_decrease >= cooldown:
+                limit = max(minimum, limit * factor)
+                last_decrease = now
+            db.execute(
+                "UPDATE rate_limit_state SET concurrency_limit = ?, last_decrease = ? WHERE name = ?",
+                (limit, last_decrease, name),
+            )
+            return limit
+
+        return self._transaction(release)
+
+    def pause(self, name: str, until: float) -> None:
+        """Pause every process's calls to the provider until the given time."""
+
+        def pause(db):
+            db.execute(
+                "UPDATE rate_limit_state SET paused_until = MAX(paused_until, ?) WHERE name = ?",
+                (until, name),
+            )
+
+        self._transaction(pause)
+
+
+shared_store = SharedStore()
@@ -0,0 +1,109 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Coroutine, Iterable
+from utils import metrics
+
+
+class _Call:
+    """An in-flight call and the number of callers waiting on it."""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Concurrent calls for the same key share one in-flight call.
+
+    The call runs in its own task, so one caller being cancelled does not
+    cancel it for the others; it is only cancelled once every caller waiting
+    on it has gone.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: dict[str, _Call] = {}
+        self.started = 0
+        self.shared = 0
+
+    def _start(self, keys: list[str], coro: Coroutine) -> _Call:
+        call = _Call(asyncio.create_task(coro))
+        for key in keys:
+            self._calls[key] = call
+
+        def forget(_):
+            for key in keys:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+
+        call.task.add_done_callback(forget)
+        self.started += 1
+        metrics.inc("singleflight_calls_total", group=self.name, result="started")
+        return call
+
+    def _join(self) -> None:
+        self.shared += 1
+        metrics.inc("singleflight_calls_total", group=self.name, result="shared")
+
+    async def _wait(self, call: _Call) -> Any:
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Return fn(), or the result of the identical call already in flight."""
+        call = self._calls.get(key)
+        if call is None:
+            call = self._start([key], fn())
+        else:
+            self._join()
+        return await self._wait(call)
+
+    async def do_many(
+        self, keys: Iterable[str], fn: Callable[[list[str]], Awaitable[dict]]
+    ) -> dict:
+        """Batched variant: fn(missing keys) returns {key: value}.
+
+        Keys already in flight are waited on; the rest are fetched with one
+        fn call. Keys the calls did not return map to None.
+        """
+        keys = list(dict.fromkeys(keys))
+        missing = [key for key in keys if key not in self._calls]
+        for key in keys:
+            if key not in missing:
+                self._join()
+        if missing:
+            self._start(missing, fn(missing))
+        calls = {id(call): call for call in (self._calls[key] for key in keys)}
+        merged: dict = {}
+        for result in await asyncio.gather(*(self._wait(c) for c in calls.values())):
+            merged.update(result)
+        return {key: merged.get(key) for key in keys}
+
+    def stats(self) -> dict:
+        return {"name": self.name, "started": self.started, "shared": self.shared}
+
+
+class KeyedLock:
+    """One asyncio lock per key, dropped again once nobody holds or waits for it."""
+
+    def __init__(self):
+        self._locks: dict[str, list] = {}  # key -> [lock, holders and waiters]
+
+    @asynccontextmanager
+    async def hold(self, key: str):
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
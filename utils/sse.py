@@ -0,0 +1,193 @@
+import asyncio, json, os, time
+from collections import deque
+from typing import AsyncGenerator, AsyncIterator, Optional
+from logger_colors import BLUE, RED, RESET
+from utils.config import (
+    SSE_BUFFER_EVENTS,
+    SSE_HEARTBEAT_SECONDS,
+    SSE_RUN_TTL,
+    SSE_SPILL_DIR,
+)
+
+HEARTBEAT = ": heartbeat\n\n"
+
+
+def format_event(event_id: str, kind: str, data: str) -> str:
+    """One SSE frame; multi-line data is sent as several data: lines."""
+    lines = "".join(f"data: {line}\n" for line in data.split("\n"))
+    return f"id: {event_id}\nevent: {kind}\n{lines}\n"
+
+
+def parse_event_id(value: Optional[str]) -> Optional[tuple[str, int]]:
+    """Split a "<run_id>:<seq>" event id, None if it is not one."""
+    run_id, _, seq = (value or "").strip().rpartition(":")
+    if not run_id or not seq.isdigit():
+        return None
+    return run_id, int(seq)
+
+
+class RunLog:
+    """The events of one run, replayable from any event id.
+
+    The newest ``max_events`` stay in memory; older ones are appended to a
+    JSON lines file in ``spill_dir`` (or dropped when it is empty) so a client
+    reconnecting far behind can still catch up. owner (the uid) and
+    fingerprint (a hash of the request) tell whether a retry is the same
+    request as the one that started the run.
+    """
+
+    def __init__(
+        self,
+        run_id: str,
+        max_events: int = SSE_BUFFER_EVENTS,
+        spill_dir: str = SSE_SPILL_DIR,
+        owner: Optional[str] = None,
+        fingerprint: Optional[str] = None,
+    ):
+        self.run_id = run_id
+        self.owner = owner
+        self.fingerprint = fingerprint
+        self.max_events = max_events
+        self.spill_path = os.path.join(spill_dir, f"{run_id}.jsonl") if spill_dir else None
+        self.events: deque[tuple[int, str, str]] = deque()  # (seq, kind, data)
+        self.last_seq = 0
+        self.spilled_seq = 0  # events up to here are no longer in memory
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Condition()
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.run_id}:{seq}"
+
+    async def append(self, kind: str, data: str) -> None:
+        self.last_seq += 1
+        self.events.append((self.last_seq, kind, data))
+        if len(self.events) > self.max_events:
+            # move the older half out in one go rather than one event at a time
+            old = [self.events.popleft() for _ in range(len(self.events) - self.max_events // 2)]
+            if self.spill_path:
+                await asyncio.to_thread(self._spill, old)
+            self.spilled_seq = old[-1][0]
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def finish(self) -> None:
+        self.done = True
+        self.finished_at = time.time()
+        async with self._changed:
+            self._changed.notify_all()
+
+    def _spill(self, events: list[tuple[int, str, str]]) -> None:
+        os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(event) + "\n" for event in events)
+
+    def _read_spill(self, after: int) -> list[tuple[int, str, str]]:
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return []
+        with open(self.spill_path, encoding="utf-8") as f:
+            events = (tuple(json.loads(line)) for line in f)
+            return [event for event in events if event[0] > after]
+
+    def remove_spill(self) -> None:
+        if self.spill_path and os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
+
+    async def follow(
+        self, after: int = 0, heartbeat: float = SSE_HEARTBEAT_SECONDS
+    ) -> AsyncGenerator[str, None]:
+        """SSE frames of every event after seq ``after``, until the run is done.
+
+        While waiting for new events a heartbeat comment is sent every
+        ``heartbeat`` seconds so proxies and mobile networks keep the
+        connection open.
+        """
+        seq = after
+        while True:
+            if seq < self.spilled_seq:
+                for event_seq, kind, data in await asyncio.to_thread(self._read_spill, seq):
+                    if event_seq > self.spilled_seq:
+                        break
+                    yield format_event(self.event_id(event_seq), kind, data)
+                    seq = event_seq
+                if seq < self.spilled_seq:
+                    # not spilled to disk, the client has to live with the gap
+                    yield format_event(
+                        self.event_id(self.spilled_seq), "truncated", str(self.spilled_seq - seq)
+                    )
+                    seq = self.spilled_seq
+            snapshot = list(self.events)
+            if seq < self.spilled_seq:
+                continue  # more was spilled while reading the file
+            for event_seq, kind, data in snapshot:
+                if event_seq > seq:
+                    yield format_event(self.event_id(event_seq), kind, data)
+                    seq = event_seq
+            if self.done and seq >= self.last_seq:
+                return
+
+            async with self._changed:
+                try:
+                    await asyncio.wait_for(
+                        self._changed.wait_for(lambda: self.last_seq > seq or self.done),
+                        heartbeat,
+                    )
+                    idle = False
+                except asyncio.TimeoutError:
+                    idle = True
+            if idle:
+                yield HEARTBEAT
+
+
+class RunRegistry:
+    """Runs keyed by id, produced by background tasks independent of any connection.
+
+    A client that drops can reconnect with ``Last-Event-ID`` and resume from
+    the run's log instead of starting the agents again. Finished runs are
+    kept for ``ttl`` seconds.
+    """
+
+    def __init__(self, ttl: int = SSE_RUN_TTL):
+        self.ttl = ttl
+        self._runs: dict[str, RunLog] = {}
+
+    def get(self, run_id: str) -> Optional[RunLog]:
+        self._expire()
+        return self._runs.get(run_id)
+
+    def create(
+        self, run_id: str, owner: Optional[str] = None, fingerprint: Optional[str] = None
+    ) -> RunLog:
+        """Register an empty log for a run that is about to be produced."""
+        self._expire()
+        log = RunLog(run_id, owner=owner, fingerprint=fingerprint)
+        self._runs[run_id] = log
+        return log
+
+    async def produce(self, log: RunLog, events: AsyncIterator[tuple[str, str]]) -> None:
+        """Append every (kind, data) of ``events`` to the log, then close it."""
+        try:
+            async for kind, data in events:
+                await log.append(kind, data)
+        except Exception as e:
+            print(f"{RED}Run {log.run_id} failed: {e}{RESET}")
+            await log.append("error", "An unexpected error occurred. Please try again later.")
+        finally:
+            await log.append("done", "")
+            await log.finish()
+
+    def _expire(self) -> None:
+        now = time.time()
+        for run_id, log in list(self._runs.items()):
+            if log.done and now - log.finished_at > self.ttl:
+                del self._runs[run_id]
+                log.remove_spill()
+                print(f"{BLUE} Expired run {RESET}=>", run_id)
+
+    def stats(self) -> dict:
+        running = sum(1 for log in self._runs.values() if not log.done)
+        return {"running": running, "finished": len(self._runs) - running}
+
+
+runs = RunRegistry()
@@ -0,0 +1,12 @@
+import re
+
+TOKEN_RE = re.compile(r"[a-z0-9+#]+")
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "i", "in",
+    "is", "it", "me", "my", "of", "on", "or", "the", "to", "want", "with",
+}
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased words of text without stop words, as matched by the caches and the corpus."""
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOP_WORDS]
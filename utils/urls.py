@@ -0,0 +1,38 @@
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# query parameters that only track the visitor and never change the page
+TRACKING_PARAMS = {"fbclid", "gclid", "msclkid", "mc_cid", "mc_eid", "ref", "ref_src"}
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase a search query and collapse whitespace so that trivially
+    different phrasings of the same query share one cache key."""
+    query = re.sub(r"\s+", " ", query.strip().lower())
+    return query.strip(" .?!,;:\"'")
+
+
+def canonicalize_url(url: str) -> str:
+    """Return a canonical form of url used to recognize the same page.
+
+    Lowercases scheme and host, drops ``www.``, default ports, fragments and
+    tracking parameters, sorts the query string and strips trailing slashes.
+    """
+    parts = urlsplit(url.strip())
+    scheme = (parts.scheme or "https").lower()
+    if scheme == "http":
+        scheme = "https"
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    path = re.sub(r"/{2,}", "/", parts.path or "/")
+    if len(path) > 1:
+        path = path.rstrip("/")
+    params = sorted(
+        (k, v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+    )
+    return urlunsplit((scheme, host, path, urlencode(params), ""))
@@ -0,0 +1,238 @@
+import asyncio
+from typing import TYPE_CHECKING, Optional
+from logger_colors import BLUE, GREEN, RED, RESET
+from utils import metrics
+from utils.cache import TTLCache
+from utils.corpus import corpus
+from utils.dedup import dedupe_documents
+from utils.hedging import Hedger
+from utils.passages import select_passages
+from utils.rate_limit import extract_governor, search_governor
+from utils.singleflight import SingleFlight
+from utils.urls import canonicalize_url, normalize_query
+from utils.config import (
+    TAVILY_API_KEY,
+    TAVILY_BASE_URL,
+    SEARCH_CACHE_TTL,
+    EXTRACT_CACHE_TTL,
+    EXTRACT_BATCH_SIZE,
+    EXTRACT_TIMEOUT,
+    SEARCH_MIN_SCORE,
+    PIPELINE_TARGET_DOCS,
+    PIPELINE_TIME_BUDGET,
+    CORPUS_MIN_HITS,
+)
+
+if TYPE_CHECKING:
+    from tavily import AsyncTavilyClient
+
+_tavily_client: Optional["AsyncTavilyClient"] = None
+
+# search results are keyed by normalized query, extracted pages by canonical url
+search_cache = TTLCache("tavily_search", ttl=SEARCH_CACHE_TTL)
+extract_cache = TTLCache("tavily_page", ttl=EXTRACT_CACHE_TTL)
+
+# concurrent identical searches, and extractions of the same page, share one request
+search_flight = SingleFlight("tavily_search")
+extract_flight = SingleFlight("tavily_extract")
+# a search slower than usual gets a second, identical request
+search_hedger = Hedger("tavily_search")
+
+
+def get_tavily_client() -> "AsyncTavilyClient":
+    """The process-wide Tavily client, created (and the SDK imported) on first use."""
+    global _tavily_client
+    if _tavily_client is None:
+        from tavily import AsyncTavilyClient
+
+        _tavily_client = AsyncTavilyClient(api_key=TAVILY_API_KEY, api_base_url=TAVILY_BASE_URL)
+    return _tavily_client
+
+
+async def cached_search(query: str) -> dict:
+    """Tavily search that is served from the cache when possible."""
+    key = normalize_query(query)
+    cached = await search_cache.get(key)
+    if cached is not None:
+        print(f"{GREEN} search cache hit {RESET}=>", key)
+        return cached
+
+    return await search_flight.do(key, lambda: _search(query, key))
+
+
+async def _search(query: str, key: str) -> dict:
+    with metrics.timer("tavily_seconds", op="search"):
+        response = await search_hedger.call(
+            lambda: search_governor.call(lambda: get_tavily_client().search(query=query))
+        )
+    if response.get("results"):
+        await search_cache.set(key, response)
+    return response
+
+
+async def _extract_urls(urls: list[str]) -> dict[str, dict]:
+    """One multi-url extract call, pages by canonical url. Errors are logged, never raised."""
+    try:
+        with metrics.timer("tavily_seconds", op="extract"):
+            response = await extract_governor.call(
+                lambda: get_tavily_client().extract(urls, timeout=EXTRACT_TIMEOUT)
+            )
+    except Exception as e:
+        print(f"{RED}[Tavily Error] Failed to extract {urls}: {e}{RESET}")
+        return {}
+
+    for failed in response.get("failed_results", []):
+        print(f"{RED}[Tavily Error] Failed to extract {failed.get('url')}: {failed.get('error')}{RESET}")
+
+    pages = {canonicalize_url(page["url"]): page for page in response.get("results", [])}
+    for key, page in pages.items():
+        await extract_cache.set(key, page)
+    return pages
+
+
+async def _extract_batch(urls: list[str]) -> list[dict]:
+    """Extract urls, joining extractions of the same pages already in flight."""
+    by_key = {canonicalize_url(url): url for url in urls}
+    pages = await extract_flight.do_many(
+        by_key, lambda keys: _extract_urls([by_key[key] for key in keys])
+    )
+    return [page for page in pages.values() if page]
+
+
+async def search_and_extract(
+    queries: list[str],
+    min_score: float = SEARCH_MIN_SCORE,
+    target_docs: int = PIPELINE_TARGET_DOCS,
+    time_budget: float = PIPELINE_TIME_BUDGET,
+) -> list[dict]:
+    """Run the searches and extract their relevant pages as a stream.
+
+    Queries are first looked up in the local corpus; those with at least
+    CORPUS_MIN_HITS fresh pages there are not searched on the web. Corpus
+    pages are scored by the fraction of query terms they match, rescaled to
+    lie between min_score and 1 like the web results they are ranked with.
+    Only pages from the web count toward target_docs, so the queries the
+    corpus does not cover still get their results. As soon as a web search
+    completes, its results above min_score are deduplicated by canonical url
+    and handed to the extraction workers in batches, while the other
+    searches are still running. Returns early, cancelling whatever is still
+    outstanding, once target_docs pages are extracted or time_budget seconds
+    have passed.
+
+    Returns:
+        Extracted documents (url, title, score, raw_content), best score first.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + time_budget
+    relevant: dict[str, dict] = {}  # canonical url -> best search result
+    pages: dict[str, dict] = {}  # canonical url -> extracted page
+    extracted: list[dict] = []  # pages fetched from the web by this call
+
+    web_queries = []
+    for query, found in zip(queries, await asyncio.gather(*(corpus.search(q) for q in queries))):
+        for page in found:
+            key = canonicalize_url(page["url"])
+            # the fraction of query terms matched, put on Tavily's scale above min_score
+            page = {**page, "score": min_score + (1 - min_score) * page["score"]}
+            if key not in relevant or page["score"] > relevant[key]["score"]:
+                relevant[key] = page
+            pages[key] = page
+        if len(found) < CORPUS_MIN_HITS:
+            web_queries.append(query)
+    from_corpus = set(pages)
+    if len(web_queries) < len(queries):
+        print(f"{GREEN} corpus covered {len(queries) - len(web_queries)} of {len(queries)} queries {RESET}")
+
+    searches = {asyncio.create_task(cached_search(q)) for q in web_queries}
+    extractions: set[asyncio.Task] = set()
+
+    while (searches or extractions) and len(pages.keys() - from_corpus) < target_docs:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            print(f"{RED} tavily pipeline ran out of its {time_budget}s budget {RESET}")
+            break
+        done, _ = await asyncio.wait(
+            searches | extractions,
+            timeout=remaining,
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+        for task in done:
+            if task in extractions:
+                extractions.discard(task)
+                for page in task.result():
+                    pages[canonicalize_url(page["url"])] = page
+                    extracted.append(page)
+                continue
+
+            searches.discard(task)
+            if task.exception() is not None:
+                print(f"{RED}[Tavily Error] Search failed: {task.exception()}{RESET}")
+                continue
+            missing = []
+            for result in task.result().get("results", []):
+                if result.get("score", 0) <= min_score:
+                    continue
+                key = canonicalize_url(result["url"])
+                if key in relevant:
+                    if result["score"] > relevant[key]["score"]:
+                        relevant[key] = result
+                    continue
+                relevant[key] = result
+                cached = await extract_cache.get(key)
+                if cached is not None:
+                    pages[key] = cached
+                else:
+                    missing.append(result["url"])
+            for i in range(0, len(missing), EXTRACT_BATCH_SIZE):
+                extractions.add(
+                    asyncio.create_task(_extract_batch(missing[i : i + EXTRACT_BATCH_SIZE]))
+                )
+
+    outstanding = searches | extractions
+    for task in outstanding:
+        task.cancel()
+    if outstanding:
+        print(f"{BLUE} cancelled {len(outstanding)} outstanding tavily requests {RESET}")
+
+    documents = [
+        {
+            "url": result["url"],
+            "title": result.get("title"),
+            "score": result["score"],
+            "raw_content": pages[key].get("raw_content"),
+        }
+        for key, result in relevant.items()
+        if key in pages
+    ]
+    documents.sort(key=lambda doc: doc["score"], reverse=True)
+    print(f"{GREEN} extracted {len(documents)} of {len(relevant)} relevant URLs {RESET}")
+    await corpus.add(
+        [
+            {**page, "title": relevant.get(canonicalize_url(page["url"]), {}).get("title")}
+            for page in extracted
+        ]
+    )
+    return documents
+
+
+async def fetch_documents(
+    queries: list[str],
+    target_docs: int = PIPELINE_TARGET_DOCS,
+    time_budget: float = PIPELINE_TIME_BUDGET,
+) -> list[dict]:
+    """Search, extract, deduplicate and keep the relevant passages: the documents handed to synthesis."""
+    documents = await search_and_extract(queries, target_docs=target_docs, time_budget=time_budget)
+    # Mirrors and syndicated copies are collapsed before they reach synthesis
+    documents = dedupe_documents(documents)
+    # and only the passages matching the queries are kept of each page
+    return select_passages(documents, queries)
+
+
+def cache_stats() -> list[dict]:
+    """Hit/miss counters of the Tavily caches."""
+    return [search_cache.stats(), extract_cache.stats()]
+
+
+def flight_stats() -> list[dict]:
+    """Started and shared counters of the Tavily single-flight groups."""
+    return [search_flight.stats(), extract_flight.stats()]
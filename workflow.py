@@ -1,26 +1,108 @@
-from agents import Runner, InputGuardrailTripwireTriggered
-from typing import AsyncGenerator
-from fastapi import FastAPI
-from fastapi.responses import StreamingResponse
+import hashlib, json, re, time, uuid
+from contextlib import asynccontextmanager
+from agents import (
+    Runner,
+    RunConfig,
+    InputGuardrailTripwireTriggered,
+    add_trace_processor,
+    set_trace_processors,
+)
+from typing import AsyncGenerator, Optional
+from urllib.parse import urlencode
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from mockData import profiles
 from classes import UserProfile
+from openai import RateLimitError
 from openai.types.responses import ResponseTextDeltaEvent
 from pydantic import BaseModel
-from supabase_session import SupabaseSession
 from logger_colors import BLUE, GREEN, RED, RESET
-from high_level_agents.requirement_gathering_agent import requirement_gathering_agent
+from high_level_agents.registry import get_agent
+from high_level_agents.research_pipeline import ResearchEvent, run_research_pipeline
+from utils import llm, metrics
+from utils.config import CHAT_DEADLINE, GRACEFUL_SHUTDOWN_SECONDS, TRACE_EXPORT, RESEARCH_MODE, validate_config
+from utils.llm import llm_flight, pool_stats
+from utils.corpus import corpus
+from utils.deadline import Deadline
+from utils.hedging import hedge_stats
+from utils.model_router import route_stats
+from utils.rate_limit import governor_stats
+from utils.report_cache import report_cache
+from utils.jobs import Job, JobRejected, job_manager
+from utils.singleflight import KeyedLock
+from utils.sessions import create_session, drain_replication, hot_sessions
+from utils.sse import parse_event_id, runs
+from utils.web_search import cache_stats, flight_stats
+
+# turns of the same user run one at a time, so their session writes never interleave
+user_locks = KeyedLock()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    validate_config()
+    yield
+    # graceful shutdown: let queued and running turns finish, then close the pool
+    await job_manager.drain(GRACEFUL_SHUTDOWN_SECONDS)
+    await drain_replication(GRACEFUL_SHUTDOWN_SECONDS)
+    await llm.close()
+
 
 # FastAPI app
 app = FastAPI(
     title="Deep Research Agent System",
     description="A deep research agent system that helps you in finding and researching about your Learning Goals roadmaps, topics, courses, videos, articles etc",
+    lifespan=lifespan,
 )
 
+# Agent and tool spans feed the /metrics histograms. Without TRACE_EXPORT the
+# default exporter is dropped and spans are only used for metrics.
+if TRACE_EXPORT:
+    add_trace_processor(metrics.MetricsProcessor())
+else:
+    set_trace_processors([metrics.MetricsProcessor()])
+
+
+async def stream_cached_report(report: str) -> AsyncGenerator[ResearchEvent, None]:
+    """Replay a cached Markdown report in paragraph sized chunks."""
+    for paragraph in report.split("\n\n"):
+        yield ResearchEvent("token", paragraph + "\n\n")
+
+
+def event_payload(event: ResearchEvent) -> tuple[str, str]:
+    """SSE event name and data of a research event."""
+    if event.kind == "revise":
+        return "revise", json.dumps({"offset": event.offset, "text": event.data})
+    return event.kind, event.data
+
+
+def degraded(user_profile: UserProfile) -> bool:
+    """Whether the deadline cut the research down; such reports are not cached."""
+    return user_profile.deadline is not None and bool(user_profile.deadline.degraded)
+
 
 async def stream_agent_response(
-    query: str, user_profile: UserProfile
-) -> AsyncGenerator[str, None]:
-    session = SupabaseSession(session_id=user_profile.uid)
+    query: str, user_profile: UserProfile, request_id: str
+) -> AsyncGenerator[tuple[str, str], None]:
+    """Run the agents for one chat turn, yielding (event name, data) pairs."""
+    metrics.request_id_var.set(request_id)
+    started = time.perf_counter()
+    first_token = True
+    requirement_gathering_agent = get_agent("requirement_gathering")
+    agent_name = requirement_gathering_agent.name
+    # when the current agent got the turn; the SDK only reports a model call
+    # once its first chunk arrives, so agent turns are timed from here
+    model_started = started
+    session = create_session(user_profile.uid, write_behind=True)
+    run_config = RunConfig(group_id=request_id, trace_metadata={"request_id": request_id})
+    researching = False  # the deep research agent has taken over
+    report_parts: list[str] = []
+
+    def note_first_token() -> None:
+        nonlocal first_token
+        if first_token:
+            metrics.observe("chat_ttft_seconds", time.perf_counter() - started)
+            first_token = False
+
     try:
         result = Runner.run_streamed(
             requirement_gathering_agent,
@@ -28,24 +110,129 @@ async def stream_agent_response(
             context=user_profile,
             session=session,
             max_turns=50,
+            run_config=run_config,
         )
         async for event in result.stream_events():
-            if event.type == "raw_response_event" and isinstance(
-                event.data, ResponseTextDeltaEvent
+            if event.type == "agent_updated_stream_event":
+                agent_name = event.new_agent.name
+                model_started = time.perf_counter()
+            elif (
+                event.type == "run_item_stream_event"
+                and event.name == "tool_output"
+            ):
+                model_started = time.perf_counter()
+            if (
+                event.type == "agent_updated_stream_event"
+                and event.new_agent.name == get_agent("deep_research").name
+                and user_profile.research_request
             ):
-                yield event.data.delta
+                researching = True
+                request = user_profile.research_request
+                request_key = request.cache_key()
+                cached = await report_cache.lookup(request_key)
+                if cached:
+                    report, similarity, age = cached
+                    print(
+                        f"{GREEN} Report cache hit {RESET}=> similarity {similarity:.2f}, age {age:.0f}s"
+                    )
+                    report_stream = stream_cached_report(report)
+                elif RESEARCH_MODE == "pipeline":
+                    report_stream = run_research_pipeline(
+                        request, user_profile, run_config
+                    )
+                else:
+                    continue
+
+                # the research is produced here instead of by the agent run
+                result.cancel()
+                report = ""
+                async for research_event in report_stream:
+                    note_first_token()
+                    yield event_payload(research_event)
+                    if research_event.kind == "token":
+                        report += research_event.data
+                    elif research_event.kind == "revise":
+                        report = report[: research_event.offset] + research_event.data
+                # the cancelled run saves nothing, so record the turn here
+                await session.add_items(
+                    [
+                        {"role": "user", "content": query},
+                        {"role": "assistant", "content": report},
+                    ]
+                )
+                if not cached and not degraded(user_profile):
+                    await report_cache.store(request_key, report)
+                return
+            elif (
+                event.type == "raw_response_event"
+                and isinstance(event.data, ResponseTextDeltaEvent)
+                and event.data.delta
+            ):
+                if model_started is not None:
+                    metrics.observe(
+                        "agent_ttft_seconds",
+                        time.perf_counter() - model_started,
+                        agent=agent_name,
+                    )
+                    model_started = None
+                note_first_token()
+                if researching:
+                    report_parts.append(event.data.delta)
+                yield "token", event.data.delta
+
+        if report_parts and not degraded(user_profile):
+            await report_cache.store(request_key, "".join(report_parts))
     except InputGuardrailTripwireTriggered:
         print("Trip wire triggered")
+    except RateLimitError as e:
+        print(f"{RED}Rate limited after retries [{request_id}]: {e}{RESET}")
+        yield "error", "⚠️ The research service is at capacity right now. Please try again in a minute."
     except Exception as e:
-        print(f"{RED}Unexpected error in stream_agent_response: {e}{RESET}")
-        yield "⚠️ An unexpected error occurred. Please try again later."
+        print(f"{RED}Unexpected error in stream_agent_response [{request_id}]: {e}{RESET}")
+        yield "error", "⚠️ An unexpected error occurred. Please try again later."
+    finally:
+        # write-behind session: persist everything the run added in one go
+        await session.flush()
+        metrics.observe("chat_stream_seconds", time.perf_counter() - started)
+
+
+async def serialized_agent_response(
+    query: str, user_profile: UserProfile, request_id: str
+) -> AsyncGenerator[tuple[str, str], None]:
+    """stream_agent_response, after any earlier turn of the same user has finished."""
+    async with user_locks.hold(user_profile.uid):
+        async for item in stream_agent_response(query, user_profile, request_id):
+            yield item
 
 
 @app.get("/system-health")
 async def system_health():
     """Endpoint to check the health of the system"""
 
-    return {"status": "System is online"}
+    return {
+        "status": "System is online",
+        "llm_pool": pool_stats(),
+        "tavily_cache": cache_stats(),
+        "report_cache": report_cache.stats(),
+        "corpus": corpus.stats(),
+        "sessions": hot_sessions.stats(),
+        "runs": runs.stats(),
+        "jobs": job_manager.stats(),
+        "singleflight": [*flight_stats(), llm_flight.stats()],
+        "rate_limits": governor_stats(),
+        "model_routes": route_stats(),
+        "hedging": hedge_stats(),
+    }
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus scrape endpoint with per-agent, per-tool and cache metrics"""
+
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
 
 
 class ChatQueryRequest(BaseModel):
@@ -53,8 +240,29 @@ class ChatQueryRequest(BaseModel):
     uid: str
 
 
-@app.post("/chat", tags=["Agent Chat"])
-async def chat(req: ChatQueryRequest):
+def request_fingerprint(query: str) -> str:
+    """Hash of a chat query, to tell a retried request from a new one under the same id."""
+    return hashlib.sha256(query.strip().encode()).hexdigest()
+
+
+def get_user_profile(uid: str) -> Optional[UserProfile]:
+    # Get user profile (mocked from list)
+    profile_data = next((p for p in profiles if p["uid"] == uid), None)
+    if not profile_data:
+        return None
+    return UserProfile(profile_data["name"], profile_data["city"], profile_data["uid"])
+
+
+def rejection_response(e: JobRejected) -> JSONResponse:
+    return JSONResponse(
+        {"error": str(e)},
+        status_code=e.status_code,
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+async def submit_chat(req: ChatQueryRequest, request_id: str):
+    """Validate a chat request and queue it as a job; returns the job or an error response."""
     print(f"{BLUE} request data{RESET}=>", req)
     query = req.query.strip()
     uid = req.uid.strip()
@@ -64,16 +272,103 @@ async def chat(req: ChatQueryRequest):
     if not uid:
         return {"error": "User ID cannot be empty."}
 
-    # Get user profile (mocked from list)
-    profile_data = next((p for p in profiles if p["uid"] == uid), None)
-    if not profile_data:
+    user_profile = get_user_profile(uid)
+    if not user_profile:
         return {"error": "Invalid user ID."}
+    # the deadline counts from arrival, time spent queued included
+    user_profile.deadline = Deadline(CHAT_DEADLINE)
+
+    try:
+        return await job_manager.submit(
+            request_id,
+            uid,
+            serialized_agent_response(query, user_profile, request_id),
+            fingerprint=request_fingerprint(query),
+        )
+    except JobRejected as e:
+        print(f"{RED} Job rejected ({e.status_code}) {RESET}=>", e)
+        return rejection_response(e)
+
+
+@app.post("/chat", tags=["Agent Chat"])
+async def chat(req: ChatQueryRequest, request: Request):
+    # a retried POST (same X-Request-ID, or a Last-Event-ID of an earlier
+    # stream) resumes the run it started instead of running the agents again
+    resume = parse_event_id(request.headers.get("last-event-id"))
+    request_id = request.headers.get("x-request-id", "")
+    after = 0
+    if resume:
+        request_id, after = resume
+    if not REQUEST_ID_RE.match(request_id):
+        request_id = uuid.uuid4().hex
+    log = runs.get(request_id)
+    if log is not None:
+        # only the same user asking the same question resumes the run
+        if log.owner != req.uid.strip() or log.fingerprint != request_fingerprint(req.query):
+            return JSONResponse(
+                {"error": "This request id belongs to a different request."}, status_code=409
+            )
+        return sse_response(log, after)
+
+    job = await submit_chat(req, request_id)
+    if not isinstance(job, Job):
+        return job
+    return sse_response(job.log, 0)
+
+
+@app.get("/chat/{run_id}/stream", tags=["Agent Chat"])
+async def resume_chat(run_id: str, request: Request, uid: str, last_event_id: str = ""):
+    """Reconnect to a running or recently finished /chat run of the user uid.
+
+    Events after the Last-Event-ID header (or the last_event_id query
+    parameter, for clients that cannot set headers) are replayed first.
+    """
+    log = runs.get(run_id)
+    if log is None or log.owner != uid.strip():
+        return JSONResponse({"error": "Unknown or expired run."}, status_code=404)
+    resume = parse_event_id(request.headers.get("last-event-id") or last_event_id)
+    after = resume[1] if resume and resume[0] == run_id else 0
+    return sse_response(log, after)
+
+
+@app.post("/jobs", tags=["Research Jobs"], status_code=202)
+async def create_job(req: ChatQueryRequest):
+    """Queue a chat turn without holding a connection open; poll or stream it by id"""
+
+    job = await submit_chat(req, uuid.uuid4().hex)
+    if not isinstance(job, Job):
+        return job
+    return {
+        **job.to_dict(),
+        "poll_url": f"/jobs/{job.id}?{urlencode({'uid': job.uid})}",
+        "stream_url": f"/jobs/{job.id}/stream?{urlencode({'uid': job.uid})}",
+    }
+
+
+@app.get("/jobs/{job_id}", tags=["Research Jobs"])
+async def get_job(job_id: str, uid: str):
+    """Status and output so far of a job of the user uid"""
+
+    job = job_manager.get(job_id)
+    if job is None or job.uid != uid.strip():
+        return JSONResponse({"error": "Unknown or expired job."}, status_code=404)
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}/stream", tags=["Research Jobs"])
+async def stream_job(job_id: str, request: Request, uid: str, last_event_id: str = ""):
+    """SSE stream of a job, resumable like /chat"""
+
+    return await resume_chat(job_id, request, uid, last_event_id)
 
-    user_profile = UserProfile(
-        profile_data["name"], profile_data["city"], profile_data["uid"]
-    )
 
+def sse_response(log, after: int) -> StreamingResponse:
     return StreamingResponse(
-        stream_agent_response(query, user_profile),
-        media_type="text/event-stream",  # For SSE
+        log.follow(after),
+        media_type="text/event-stream",
+        headers={
+            "X-Request-ID": log.run_id,
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # keep nginx from buffering the stream
+        },
     )